@@ -3,14 +3,13 @@ import uuid
 from datetime import datetime, timezone
 from typing import Dict, Optional, Any, List, Tuple
 
-from azure.cosmos import CosmosClient, exceptions as cosmos_exceptions
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.agents import ChatCompletionAgent
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 
 from agents.base_agent import BaseAgent
-from agents.attendance.attendance_skill import AttendanceSkill
+from agents.attendance.attendance_skill import get_attendance_skill
 
 
 class AttendanceAgent(BaseAgent):
@@ -54,22 +53,19 @@ class AttendanceAgent(BaseAgent):
                 "COSMOS_ENDPOINT, and COSMOS_KEY environment variables.\n"
             )
 
-        kernel = Kernel()
-        az_service = AzureChatCompletion(
-            service_id=f"{self.get_agent_name().lower()}_chat_service",
-            api_key=config["openai_key"],
+        return self.create_kernel_and_service(
             endpoint=config["openai_endpoint"],
+            api_key=config["openai_key"],
             deployment_name=config["deployment_name"],
             api_version=config["api_version"]
         )
-        kernel.add_service(az_service)
-        return kernel, az_service
 
     def initialize_skills(self, config: Dict[str, Optional[str]], kernel: Kernel) -> List[Any]:
         """Initialize and return the AttendanceSkill."""
-        cosmos_client = CosmosClient(config["cosmos_endpoint"], config["cosmos_key"])
-        attendance_skill = AttendanceSkill(
-            cosmos_client=cosmos_client,
+        # Shared with the /attendance HTTP endpoints
+        attendance_skill = get_attendance_skill(
+            cosmos_endpoint=config["cosmos_endpoint"],
+            cosmos_key=config["cosmos_key"],
             db_name=config["cosmos_db"],
             container_name=config["cosmos_container"]
         )
@@ -81,7 +77,10 @@ class AttendanceAgent(BaseAgent):
         agent_instructions = (
             f"Current UTC time: {datetime.now(timezone.utc).isoformat()}\n"
             "You are a helpful assistant that manages check-ins and attendance queries. "
-            "Use 'check_in_event' to record attendance, or 'query_attendance' to report on it. "
+            "Use 'check_in_event' to record attendance, 'bulk_check_in' to check several people in to the same event, "
+            "or 'query_attendance' to report on it. Checking someone in again is harmless. "
+            "For statistics use 'get_event_headcount' (how many attended an event), 'get_attendance_stats' "
+            "(a user's check-ins and streaks) and 'get_course_attendance' (attendance rate of a course). "
             "Always confirm actions taken or information found. "
             "If there are any issues with the database operations, clearly explain what went wrong."
         )
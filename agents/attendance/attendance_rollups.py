@@ -0,0 +1,270 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from agents.data_dir import data_path
+
+ATTENDANCE_ROLLUP_DB = os.getenv("ATTENDANCE_ROLLUP_DB") or data_path("attendance_rollups.db")
+ATTENDANCE_CHANGE_FEED_POLL_SECONDS = float(os.getenv("ATTENDANCE_CHANGE_FEED_POLL_SECONDS", "5"))
+# Counted record ids are remembered for this many days (by check-in date), then pruned
+ATTENDANCE_SEEN_RETENTION_DAYS = int(os.getenv("ATTENDANCE_SEEN_RETENTION_DAYS", "30"))
+SEEN_PRUNE_INTERVAL_SECONDS = 3600
+# Course code taken from the event name when a record has no 'course' field, e.g. "COMP101 Lecture 3" -> COMP101
+ATTENDANCE_COURSE_PATTERN = re.compile(
+    os.getenv("ATTENDANCE_COURSE_PATTERN", r"\b([A-Za-z]{2,5})\s?(\d{3,4})\b")
+)
+
+
+def course_of(doc: Dict[str, Any]) -> Optional[str]:
+    if doc.get("course"):
+        return str(doc["course"]).upper()
+    match = ATTENDANCE_COURSE_PATTERN.search(doc.get("event_name") or "")
+    return "".join(match.groups()).upper() if match else None
+
+
+class AttendanceRollups:
+    """Per-event, per-user and per-course attendance counters kept in a local SQLite store.
+
+    A daemon thread tails the Attendance container's change feed (from the beginning on
+    first run, then from a persisted continuation) and folds each new check-in into the
+    counters, so dashboard reads are single-row lookups instead of cross-partition scans.
+    Record ids are remembered for ATTENDANCE_SEEN_RETENTION_DAYS, so an upserted re-check-in
+    is never counted twice; records dated before the pruned horizon are ignored, so a feed
+    replay cannot recount them either.
+    """
+
+    def __init__(self, container, db_path: str = ATTENDANCE_ROLLUP_DB,
+                 poll_interval: float = ATTENDANCE_CHANGE_FEED_POLL_SECONDS):
+        self.container = container
+        self.poll_interval = poll_interval
+        self.seen_retention_days = ATTENDANCE_SEEN_RETENTION_DAYS
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, day TEXT)")
+            if "day" not in {column[1] for column in self.conn.execute("PRAGMA table_info(seen)")}:
+                # Stores from before pruning: age existing ids out from today
+                self.conn.execute("ALTER TABLE seen ADD COLUMN day TEXT")
+                self.conn.execute("UPDATE seen SET day = ?", (datetime.utcnow().date().isoformat(),))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_day ON seen (day)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS event_counts ("
+                " event_key TEXT PRIMARY KEY,"
+                " event_name TEXT NOT NULL,"
+                " course TEXT,"
+                " headcount INTEGER NOT NULL,"
+                " first_check_in TEXT,"
+                " last_check_in TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_stats ("
+                " user_id TEXT PRIMARY KEY,"
+                " check_ins INTEGER NOT NULL,"
+                " last_day TEXT NOT NULL,"
+                " current_streak INTEGER NOT NULL,"
+                " longest_streak INTEGER NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS course_stats ("
+                " course TEXT PRIMARY KEY,"
+                " sessions INTEGER NOT NULL,"
+                " students INTEGER NOT NULL,"
+                " check_ins INTEGER NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS course_students ("
+                " course TEXT NOT NULL,"
+                " user_id TEXT NOT NULL,"
+                " sessions INTEGER NOT NULL,"
+                " PRIMARY KEY (course, user_id))"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'pruned_before'").fetchone()
+        self._pruned_before = row[0] if row else ""
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="attendance-rollups", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'continuation'").fetchone()
+        continuation = row[0] if row else None
+        while not self._stop.is_set():
+            try:
+                # Headers of this feed's own page requests; the client's last_response_headers is shared
+                # with check-ins and lookups on the same container and may hold an item's etag instead
+                responses: List[Any] = []
+                feed = self.container.query_items_change_feed(
+                    is_start_from_beginning=continuation is None, continuation=continuation,
+                    response_hook=lambda headers, _: responses.append(headers)
+                )
+                for doc in feed:
+                    self.apply(doc)
+                new_continuation = responses[-1].get("etag") if responses else None
+                if new_continuation and new_continuation != continuation:
+                    continuation = new_continuation
+                    with self._lock, self.conn:
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO meta (key, value) VALUES ('continuation', ?)", (continuation,)
+                        )
+            except Exception as e:
+                print(f"[AttendanceRollups] Change feed read failed: {e}")
+                if continuation is not None and getattr(e, "status_code", None) == 400:
+                    # Unusable continuation: replay from the beginning; already-counted ids are skipped
+                    continuation = None
+                    with self._lock, self.conn:
+                        self.conn.execute("DELETE FROM meta WHERE key = 'continuation'")
+            # Only once the feed has been read through, so a first full read is never cut short
+            if continuation is not None and time.time() - self._pruned_at >= SEEN_PRUNE_INTERVAL_SECONDS:
+                try:
+                    self.prune_seen()
+                except sqlite3.Error as e:
+                    print(f"[AttendanceRollups] Could not prune counted ids: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def prune_seen(self):
+        """Forget counted ids dated before the retention window; older records are ignored from now on."""
+        cutoff = (datetime.utcnow().date() - timedelta(days=self.seen_retention_days)).isoformat()
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM seen WHERE day < ?", (cutoff,))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('pruned_before', ?)", (cutoff,))
+            self._pruned_before = cutoff
+        self._pruned_at = time.time()
+
+    def apply(self, doc: Dict[str, Any]):
+        """Fold one attendance record into the counters (no-op if it was already counted)."""
+        user_id, event_name = doc.get("user_id"), doc.get("event_name")
+        if not doc.get("checked_in") or not user_id or not event_name or not doc.get("id"):
+            return
+        key = doc.get("event_key") or event_name.strip().lower()
+        timestamp = doc.get("timestamp") or datetime.utcnow().isoformat()
+        day = timestamp[:10]
+        course = course_of(doc)
+
+        with self._lock, self.conn:
+            if day < self._pruned_before:
+                # Its id may have been pruned already; it was counted when it was new
+                return
+            if self.conn.execute("INSERT OR IGNORE INTO seen (id, day) VALUES (?, ?)", (doc["id"], day)).rowcount == 0:
+                return
+
+            new_session = self.conn.execute(
+                "SELECT 1 FROM event_counts WHERE event_key = ?", (key,)
+            ).fetchone() is None
+            self.conn.execute(
+                "INSERT INTO event_counts (event_key, event_name, course, headcount, first_check_in, last_check_in)"
+                " VALUES (?, ?, ?, 1, ?, ?)"
+                " ON CONFLICT(event_key) DO UPDATE SET headcount = headcount + 1,"
+                " first_check_in = MIN(first_check_in, excluded.first_check_in),"
+                " last_check_in = MAX(last_check_in, excluded.last_check_in)",
+                (key, event_name, course, timestamp, timestamp)
+            )
+
+            self._apply_streak(user_id, day)
+
+            if course:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO course_stats (course, sessions, students, check_ins) VALUES (?, 0, 0, 0)",
+                    (course,)
+                )
+                new_student = self.conn.execute(
+                    "INSERT OR IGNORE INTO course_students (course, user_id, sessions) VALUES (?, ?, 0)",
+                    (course, user_id)
+                ).rowcount == 1
+                self.conn.execute(
+                    "UPDATE course_students SET sessions = sessions + 1 WHERE course = ? AND user_id = ?",
+                    (course, user_id)
+                )
+                self.conn.execute(
+                    "UPDATE course_stats SET sessions = sessions + ?, students = students + ?, check_ins = check_ins + 1"
+                    " WHERE course = ?",
+                    (int(new_session), int(new_student), course)
+                )
+
+    def _apply_streak(self, user_id: str, day: str):
+        # Caller holds the lock and the transaction. A streak counts consecutive days with a check-in.
+        row = self.conn.execute(
+            "SELECT last_day, current_streak, longest_streak FROM user_stats WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            self.conn.execute(
+                "INSERT INTO user_stats (user_id, check_ins, last_day, current_streak, longest_streak)"
+                " VALUES (?, 1, ?, 1, 1)", (user_id, day)
+            )
+            return
+        last_day, streak, longest = row
+        try:
+            gap = (date.fromisoformat(day) - date.fromisoformat(last_day)).days
+        except ValueError:
+            gap = 0
+        if gap == 1:
+            streak += 1
+        elif gap > 1:
+            streak = 1
+        # gap <= 0: same day, or a late record for an earlier day - the streak is unchanged
+        self.conn.execute(
+            "UPDATE user_stats SET check_ins = check_ins + 1, last_day = MAX(last_day, ?),"
+            " current_streak = ?, longest_streak = ? WHERE user_id = ?",
+            (day, streak, max(longest, streak), user_id)
+        )
+
+    def event_headcount(self, event_name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT event_name, course, headcount, first_check_in, last_check_in FROM event_counts WHERE event_key = ?",
+                (event_name.strip().lower(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("event_name", "course", "headcount", "first_check_in", "last_check_in"), row))
+
+    def user_stats(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT check_ins, last_day, current_streak, longest_streak FROM user_stats WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        check_ins, last_day, streak, longest = row
+        # A streak is broken once a full day passes without a check-in
+        if last_day < (datetime.utcnow().date() - timedelta(days=1)).isoformat():
+            streak = 0
+        return {"user_id": user_id, "check_ins": check_ins, "last_check_in_day": last_day,
+                "current_streak_days": streak, "longest_streak_days": longest}
+
+    def course_stats(self, course: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Course attendance rate: check-ins / (sessions held x students seen); per student if user_id is given."""
+        course = course.strip().upper().replace(" ", "")
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT sessions, students, check_ins FROM course_stats WHERE course = ?", (course,)
+            ).fetchone()
+            attended = None
+            if row is not None and user_id:
+                student = self.conn.execute(
+                    "SELECT sessions FROM course_students WHERE course = ? AND user_id = ?", (course, user_id)
+                ).fetchone()
+                attended = student[0] if student else 0
+        if row is None:
+            return None
+        sessions, students, check_ins = row
+        stats = {"course": course, "sessions": sessions, "students": students,
+                 "attendance_rate": round(check_ins / (sessions * students), 3) if sessions and students else None}
+        if user_id:
+            stats.update({"user_id": user_id, "sessions_attended": attended,
+                          "user_attendance_rate": round(attended / sessions, 3) if sessions else None})
+        return stats
@@ -1,55 +1,269 @@
 from azure.cosmos import CosmosClient, exceptions as cosmos_exceptions
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 from datetime import datetime, timezone
-import uuid
-from typing import Optional
+import asyncio
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from agents.attendance.attendance_rollups import AttendanceRollups
+from agents.attendance.checkin_queue import CheckInQueue
+
+# Concurrent upserts per bulk check-in; the Cosmos client is synchronous, so each runs on a worker thread
+ATTENDANCE_BULK_CONCURRENCY = int(os.getenv("ATTENDANCE_BULK_CONCURRENCY", "16"))
+
+# Partition key path that makes every per-user read a point read or a single-partition query.
+# Containers partitioned on anything else are queried cross-partition.
+USER_PARTITION_KEY_PATHS = ["/user_id"]
+ATTENDANCE_PAGE_SIZE = 100
+ATTENDANCE_LIST_LIMIT = 50
+# Also probe for records written before ids/event keys were deterministic; disable once they are migrated
+ATTENDANCE_LEGACY_LOOKUP = os.getenv("ATTENDANCE_LEGACY_LOOKUP", "true").lower() == "true"
+# Maintain headcount/streak/course-rate rollups from the container's change feed
+ATTENDANCE_ROLLUPS = os.getenv("ATTENDANCE_ROLLUPS", "true").lower() == "true"
+# Acknowledge check-ins once they are in a local durable queue and write them to Cosmos in the background
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "true").lower() == "true"
+
+# Characters Cosmos DB does not allow in an item id
+_INVALID_ID_CHARS = re.compile(r"[/\\?#]")
+
+
+def event_key(event_name: str) -> str:
+    """Normalized event name stored on each record, so lookups are exact (indexable) matches."""
+    return event_name.strip().lower()
+
+
+def attendance_id(event_name: str, user_id: str) -> str:
+    """Deterministic item id, so checking the same user in to the same event twice is an overwrite."""
+    event = _INVALID_ID_CHARS.sub("_", event_key(event_name))
+    user = _INVALID_ID_CHARS.sub("_", user_id.strip())
+    return f"{event}:{user}"
+
 
 # --- AttendanceSkill Plugin ---
 class AttendanceSkill:
-    def __init__(self, cosmos_client: CosmosClient, db_name: str, container_name: str):
+    def __init__(self, cosmos_client: CosmosClient, db_name: str, container_name: str, use_rollups: bool = False,
+                 write_behind: bool = False):
         self.container = cosmos_client.get_database_client(db_name).get_container_client(container_name)
+        self._partitioned_by_user: Optional[bool] = None
+        self.rollups: Optional[AttendanceRollups] = None
+        if use_rollups:
+            self.rollups = AttendanceRollups(self.container)
+            self.rollups.start()
+        self.checkin_queue: Optional[CheckInQueue] = None
+        if write_behind:
+            self.checkin_queue = CheckInQueue(self.container)
+            self.checkin_queue.start()
 
-    @kernel_function(name="check_in_event", description="Store a check-in event in Cosmos DB.")
-    def check_in_event(self, user_id: str, event_name: str) -> str:
-        item = {
-            "id": str(uuid.uuid4()),
+    def _check_in_record(self, user_id: str, event_name: str) -> dict:
+        return {
+            "id": attendance_id(event_name, user_id),
             "user_id": user_id,
             "event_name": event_name,
+            "event_key": event_key(event_name),
             "checked_in": True,
             "timestamp": datetime.utcnow().isoformat()
         }
+
+    @kernel_function(name="check_in_event", description="Store a check-in event in Cosmos DB.")
+    def check_in_event(self, user_id: str, event_name: str) -> str:
+        if self.checkin_queue is not None:
+            self.checkin_queue.enqueue([self._check_in_record(user_id, event_name)])
+            return f"Check-in successful for event '{event_name}'."
         try:
-            self.container.create_item(body=item)
+            # Upsert: a repeated check-in replaces the earlier record instead of duplicating it
+            self.container.upsert_item(body=self._check_in_record(user_id, event_name))
             return f"Check-in successful for event '{event_name}'."
         except cosmos_exceptions.CosmosHttpResponseError as e:
             print(f"[AttendanceSkill] Cosmos DB error: {e}")
             return "Error: Could not store the check-in record."
 
+    async def check_in_many(self, event_name: str, user_ids: List[str]) -> Dict[str, List[str]]:
+        """Check many users in to one event concurrently. Returns the checked-in and failed user ids."""
+        unique_ids = list(dict.fromkeys(u.strip() for u in user_ids if u and u.strip()))
+        if self.checkin_queue is not None:
+            # One local transaction for the whole batch; the queue's worker writes them to Cosmos
+            records = [self._check_in_record(u, event_name) for u in unique_ids]
+            await asyncio.to_thread(self.checkin_queue.enqueue, records)
+            return {"checked_in": unique_ids, "failed": []}
+
+        semaphore = asyncio.Semaphore(ATTENDANCE_BULK_CONCURRENCY)
+
+        async def upsert(user_id: str) -> bool:
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(self.container.upsert_item, body=self._check_in_record(user_id, event_name))
+                    return True
+                except cosmos_exceptions.CosmosHttpResponseError as e:
+                    print(f"[AttendanceSkill] Cosmos DB error checking in {user_id}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(upsert(u) for u in unique_ids))
+        return {
+            "checked_in": [u for u, ok in zip(unique_ids, results) if ok],
+            "failed": [u for u, ok in zip(unique_ids, results) if not ok],
+        }
+
+    @kernel_function(
+        name="bulk_check_in",
+        description="Check several people in to one event at once. user_ids is a comma-separated list."
+    )
+    async def bulk_check_in(self, event_name: str, user_ids: str) -> str:
+        result = await self.check_in_many(event_name, user_ids.split(","))
+        if not result["checked_in"] and not result["failed"]:
+            return "Error: No user ids were given."
+        message = f"Checked in {len(result['checked_in'])} user(s) to '{event_name}'."
+        if result["failed"]:
+            message += f" Could not check in: {', '.join(result['failed'])}."
+        return message
+
+    def partitioned_by_user(self) -> bool:
+        """Whether the container's partition key is /user_id, read from its definition once."""
+        if self._partitioned_by_user is None:
+            try:
+                paths = self.container.read()["partitionKey"]["paths"]
+            except (cosmos_exceptions.CosmosHttpResponseError, KeyError) as e:
+                # Cross-partition queries are correct for any partitioning; try again on the next lookup
+                print(f"[AttendanceSkill] Could not read the container's partition key: {e}")
+                return False
+            self._partitioned_by_user = paths == USER_PARTITION_KEY_PATHS
+            if not self._partitioned_by_user:
+                print(f"[AttendanceSkill] Container is partitioned on {paths}; per-user lookups run cross-partition.")
+        return self._partitioned_by_user
+
+    def _user_scope(self, user_id: str) -> dict:
+        if self.partitioned_by_user():
+            return {"partition_key": user_id}
+        return {"enable_cross_partition_query": True}
+
+    def has_attended(self, user_id: str, event_name: str) -> bool:
+        """Whether user_id checked in to event_name: a point read, then a TOP 1 probe for older records."""
+        # Acknowledged but not yet written to Cosmos
+        if self.checkin_queue is not None and self.checkin_queue.is_pending(attendance_id(event_name, user_id)):
+            return True
+        if self.partitioned_by_user():
+            try:
+                item = self.container.read_item(item=attendance_id(event_name, user_id), partition_key=user_id)
+                if item.get("checked_in"):
+                    return True
+            except cosmos_exceptions.CosmosResourceNotFoundError:
+                pass
+            if not ATTENDANCE_LEGACY_LOOKUP:
+                return False
+        # Records written before ids were deterministic have random ids and may lack event_key
+        query = (
+            "SELECT TOP 1 VALUE 1 FROM c WHERE c.user_id=@uid AND c.checked_in=true AND "
+            "(c.event_key=@key OR (NOT IS_DEFINED(c.event_key) AND LOWER(c.event_name)=@key))"
+        )
+        params = [{"name": "@uid", "value": user_id}, {"name": "@key", "value": event_key(event_name)}]
+        return any(True for _ in self.container.query_items(query=query, parameters=params, **self._user_scope(user_id)))
+
+    def list_attended_events(self, user_id: str, limit: int = ATTENDANCE_LIST_LIMIT) -> Tuple[List[str], int]:
+        """Up to `limit` event names the user checked in to (newest first) and the total count.
+
+        Check-ins still waiting in the write-behind queue are newer than anything stored, so they come first.
+        """
+        pending: List[str] = []
+        if self.checkin_queue is not None:
+            pending = [record["event_name"] for record in self.checkin_queue.pending_for_user(user_id)]
+        events, total = self._stored_events(user_id, limit)
+        if not pending:
+            return events, total
+        # A queued re-check-in replaces its stored record rather than adding an event
+        pending_keys = {event_key(name) for name in pending}
+        stored = [name for name in events if event_key(name) not in pending_keys]
+        return (pending + stored)[:limit], total + len(pending) - (len(events) - len(stored))
+
+    def _stored_events(self, user_id: str, limit: int) -> Tuple[List[str], int]:
+        query = "SELECT c.event_name FROM c WHERE c.user_id=@uid AND c.checked_in=true ORDER BY c.timestamp DESC"
+        params = [{"name": "@uid", "value": user_id}]
+        pages = self.container.query_items(
+            query=query, parameters=params, max_item_count=min(limit, ATTENDANCE_PAGE_SIZE), **self._user_scope(user_id)
+        ).by_page()
+        events: List[str] = []
+        # Stop fetching pages once we have enough instead of materializing every record
+        for page in pages:
+            events.extend(item["event_name"] for item in page)
+            if len(events) >= limit:
+                break
+        if len(events) < limit:
+            return events, len(events)
+        count_query = "SELECT VALUE COUNT(1) FROM c WHERE c.user_id=@uid AND c.checked_in=true"
+        total = next(iter(self.container.query_items(query=count_query, parameters=params, **self._user_scope(user_id))), len(events))
+        return events[:limit], total
+
     @kernel_function(name="query_attendance", description="Query attendance records from Cosmos DB.")
     def query_attendance(self, user_id: str, event_name: Optional[str] = None) -> str:
         try:
             if event_name:
-                query = "SELECT * FROM c WHERE c.user_id=@uid AND LOWER(c.event_name)=LOWER(@ename) AND c.checked_in=true"
-                params = [{"name": "@uid", "value": user_id}, {"name": "@ename", "value": event_name}]
-            else:
-                query = "SELECT * FROM c WHERE c.user_id=@uid AND c.checked_in=true"
-                params = [{"name": "@uid", "value": user_id}]
-
-            items = list(self.container.query_items(
-                query=query,
-                parameters=params,
-                enable_cross_partition_query=True
-            ))
-
-            if not items:
-                return f"No attendance records found{f' for {event_name}' if event_name else ''}."
-            if event_name:
-                return f"Yes, you have checked in to {event_name}."
-            else:
-                events = [item["event_name"] for item in items]
-                return "You checked in to: " + ", ".join(events)
+                if self.has_attended(user_id, event_name):
+                    return f"Yes, you have checked in to {event_name}."
+                return f"No attendance records found for {event_name}."
+
+            events, total = self.list_attended_events(user_id)
+            if not events:
+                return "No attendance records found."
+            more = f" (and {total - len(events)} more)" if total > len(events) else ""
+            return "You checked in to: " + ", ".join(events) + more
         except cosmos_exceptions.CosmosHttpResponseError as e:
             print(f"[AttendanceSkill] Cosmos DB error: {e}")
             return "Error: Could not query attendance records."
 
+    @kernel_function(
+        name="get_event_headcount",
+        description="How many people checked in to an event, with the first and last check-in times."
+    )
+    def get_event_headcount(self, event_name: str) -> str:
+        if self.rollups is None:
+            return "Error: Attendance statistics are not enabled."
+        stats = self.rollups.event_headcount(event_name)
+        if stats is None:
+            return f"No check-ins recorded for {event_name}."
+        return json.dumps(stats, separators=(",", ":"))
+
+    @kernel_function(
+        name="get_attendance_stats",
+        description="A user's total check-ins and their current and longest streaks of consecutive days attended."
+    )
+    def get_attendance_stats(self, user_id: str) -> str:
+        if self.rollups is None:
+            return "Error: Attendance statistics are not enabled."
+        stats = self.rollups.user_stats(user_id)
+        if stats is None:
+            return f"No attendance recorded for {user_id}."
+        return json.dumps(stats, separators=(",", ":"))
+
+    @kernel_function(
+        name="get_course_attendance",
+        description=(
+            "Attendance rate of a course (e.g. 'COMP101') across its sessions; "
+            "if user_id is given, also that user's rate in the course."
+        )
+    )
+    def get_course_attendance(self, course: str, user_id: Optional[str] = None) -> str:
+        if self.rollups is None:
+            return "Error: Attendance statistics are not enabled."
+        stats = self.rollups.course_stats(course, user_id)
+        if stats is None:
+            return f"No attendance recorded for course {course}."
+        return json.dumps(stats, separators=(",", ":"))
+
+
+_skills: Dict[Tuple[str, str, str, str], AttendanceSkill] = {}
+_skills_lock = threading.Lock()
+
 
+def get_attendance_skill(cosmos_endpoint: str, cosmos_key: str, db_name: str, container_name: str) -> AttendanceSkill:
+    """Return the shared AttendanceSkill for a container, so the agent and HTTP endpoints reuse one Cosmos client."""
+    key = (cosmos_endpoint, cosmos_key, db_name, container_name)
+    with _skills_lock:
+        skill = _skills.get(key)
+        if skill is None:
+            skill = AttendanceSkill(
+                CosmosClient(cosmos_endpoint, cosmos_key), db_name, container_name,
+                use_rollups=ATTENDANCE_ROLLUPS, write_behind=ATTENDANCE_WRITE_BEHIND
+            )
+            _skills[key] = skill
+        return skill
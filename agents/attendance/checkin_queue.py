@@ -0,0 +1,139 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from azure.cosmos import exceptions as cosmos_exceptions
+
+from agents.data_dir import data_path
+
+ATTENDANCE_QUEUE_DB = os.getenv("ATTENDANCE_QUEUE_DB") or data_path("attendance_queue.db")
+ATTENDANCE_QUEUE_BATCH = int(os.getenv("ATTENDANCE_QUEUE_BATCH", "100"))
+ATTENDANCE_QUEUE_FLUSH_SECONDS = float(os.getenv("ATTENDANCE_QUEUE_FLUSH_SECONDS", "1"))
+ATTENDANCE_QUEUE_CONCURRENCY = int(os.getenv("ATTENDANCE_QUEUE_CONCURRENCY", "16"))
+MAX_RETRY_DELAY_SECONDS = 300.0
+
+
+class CheckInQueue:
+    """Durable write-behind queue for check-in records.
+
+    Records are committed to a local SQLite (WAL) table keyed by their deterministic id,
+    which both acknowledges the tap and dedupes repeats before they reach Cosmos. A daemon
+    thread upserts due records in batches and deletes them once stored; failures are retried
+    with exponential backoff, so a Cosmos outage only delays writes instead of losing them.
+    """
+
+    def __init__(self, container, db_path: str = ATTENDANCE_QUEUE_DB, batch_size: int = ATTENDANCE_QUEUE_BATCH,
+                 flush_interval: float = ATTENDANCE_QUEUE_FLUSH_SECONDS):
+        self.container = container
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=ATTENDANCE_QUEUE_CONCURRENCY, thread_name_prefix="checkin-flush")
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                " id TEXT PRIMARY KEY,"
+                " body TEXT NOT NULL,"
+                " enqueued_at REAL NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_next_attempt ON pending (next_attempt)")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="attendance-write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def enqueue(self, records: List[Dict[str, Any]]):
+        """Durably queue records for upsert; a newer record replaces a pending one with the same id."""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pending (id, body, enqueued_at, attempts, next_attempt) VALUES (?, ?, ?, 0, ?)",
+                [(r["id"], json.dumps(r), now, now) for r in records]
+            )
+        self._wake.set()
+
+    def is_pending(self, record_id: str) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM pending WHERE id = ?", (record_id,)).fetchone() is not None
+
+    def pending_for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """Queued records for one user, newest first."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT body FROM pending WHERE json_extract(body, '$.user_id') = ? ORDER BY enqueued_at DESC",
+                (user_id,)
+            ).fetchall()
+        return [json.loads(body) for (body,) in rows]
+
+    def depth(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Clear before reading the table, so a tap enqueued during the flush still wakes the next wait
+            self._wake.clear()
+            try:
+                flushed = self.flush()
+            except Exception as e:
+                print(f"[CheckInQueue] Flush failed: {e}")
+                flushed = 0
+            # Keep draining while full batches come back; otherwise wait for new taps or the next retry
+            if flushed < self.batch_size:
+                self._wake.wait(self.flush_interval)
+
+    def flush(self) -> int:
+        """Upsert one batch of due records. Returns how many were attempted."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, body, enqueued_at, attempts FROM pending WHERE next_attempt <= ? ORDER BY enqueued_at LIMIT ?",
+                (time.time(), self.batch_size)
+            ).fetchall()
+        if not rows:
+            return 0
+
+        outcomes = list(self._executor.map(lambda row: self._upsert(json.loads(row[1])), rows))
+        now = time.time()
+        with self._lock, self.conn:
+            for (record_id, _, enqueued_at, attempts), outcome in zip(rows, outcomes):
+                if outcome == "retry":
+                    delay = min(MAX_RETRY_DELAY_SECONDS, 2.0 ** attempts)
+                    self.conn.execute(
+                        "UPDATE pending SET attempts = attempts + 1, next_attempt = ? WHERE id = ? AND enqueued_at = ?",
+                        (now + delay, record_id, enqueued_at)
+                    )
+                else:
+                    # Only remove the version we wrote; a re-check-in queued meanwhile stays pending
+                    self.conn.execute("DELETE FROM pending WHERE id = ? AND enqueued_at = ?", (record_id, enqueued_at))
+        return len(rows)
+
+    def _upsert(self, record: Dict[str, Any]) -> str:
+        try:
+            self.container.upsert_item(body=record)
+            return "stored"
+        except cosmos_exceptions.CosmosHttpResponseError as e:
+            if e.status_code == 400:
+                print(f"[CheckInQueue] Dropping invalid check-in {record.get('id')}: {e}")
+                return "dropped"
+            print(f"[CheckInQueue] Cosmos DB error, will retry {record.get('id')}: {e}")
+            return "retry"
+        except Exception as e:
+            print(f"[CheckInQueue] Could not store {record.get('id')}, will retry: {e}")
+            return "retry"
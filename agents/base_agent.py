@@ -4,6 +4,8 @@ from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.agents import ChatCompletionAgent
 
+from agents.service_registry import get_chat_service
+
 class BaseAgent(ABC):
     """Base class that all agents must implement to be compatible with the Triage Agent."""
     
@@ -33,6 +35,15 @@ class BaseAgent(ABC):
         """Initialize and return the kernel and service for this agent."""
         pass
 
+    def create_kernel_and_service(self, endpoint: str, api_key: str, deployment_name: str,
+                                  api_version: Optional[str] = None) -> Tuple[Kernel, AzureChatCompletion]:
+        """Create a kernel backed by the shared AzureChatCompletion service for this deployment.
+        Agents on the same endpoint/deployment/API version share one client and connection pool."""
+        kernel = Kernel()
+        az_service = get_chat_service(endpoint, api_key, deployment_name, api_version)
+        kernel.add_service(az_service)
+        return kernel, az_service
+
     @abstractmethod
     def initialize_skills(self, config: Dict[str, Optional[str]], kernel: Kernel) -> List[Any]:
         """Initialize and return any skills/plugins this agent needs."""
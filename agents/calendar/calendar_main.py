@@ -28,6 +28,7 @@ class CalendarAgent(BaseAgent):
             "azure_openai_api_endpoint": os.getenv("AZURE_OPENAI_API_ENDPOINT"),
             "openai_key": os.getenv("AZURE_OPENAI_API_KEY"),
             "azure_openai_deployment_name": os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
+            "azure_openai_api_version": os.getenv("AZURE_OPENAI_API_VERSION", "2024-12-01-preview"),
             "graph_access_token": os.getenv("GRAPH_ACCESS_TOKEN"),
         }
 
@@ -49,20 +50,16 @@ class CalendarAgent(BaseAgent):
                 "and GRAPH_ACCESS_TOKEN environment variables.\n"
             )
 
-        kernel = Kernel()
-        az_service = AzureChatCompletion(
-            service_id=f"{self.get_agent_name().lower()}_chat_service",
+        return self.create_kernel_and_service(
+            endpoint=config["azure_openai_api_endpoint"],
             api_key=config["openai_key"],
-            endpoint=config["openai_endpoint"],
-            deployment_name=config["deployment_name"],
-            api_version=config["api_version"]
+            deployment_name=config["azure_openai_deployment_name"],
+            api_version=config["azure_openai_api_version"]
         )
-        kernel.add_service(az_service)
-        return kernel, az_service
 
     def initialize_skills(self, config: Dict[str, Optional[str]], kernel: Kernel) -> List[Any]:
         """Initialize and return the CalendarSkill."""
-        calendar_skill = CalendarSkill(graph_token=config["graph_token"])
+        calendar_skill = CalendarSkill(graph_token=config["graph_access_token"])
         kernel.add_plugin(plugin=calendar_skill, plugin_name="CalendarSkill")
         return [calendar_skill]
 
@@ -72,6 +69,7 @@ class CalendarAgent(BaseAgent):
             f"Current UTC time: {datetime.now(timezone.utc).isoformat()}\n"
             "You are a helpful assistant that can schedule or cancel calendar events and report schedule on UK london time. "
             "Use the function calling capability to invoke create_event, find_free_slots, cancel_events, or report_schedule as needed from the CalendarSkill."
+            "To find a time for a group meeting, pass every attendee's email address (and any room addresses) to find_free_slots in a single call. "
             "Always confirm actions taken or information found."
         )
         
@@ -1,5 +1,4 @@
 import os
-import requests
 import asyncio
 from typing import Optional, List, Dict, Any
 
@@ -10,54 +9,103 @@ from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 from semantic_kernel.agents import ChatCompletionAgent
 
+from agents.calendar.graph_client import GraphClient, get_graph_client
+from agents.calendar.event_cache import CalendarEventCache, get_event_cache
+from agents.calendar.free_busy import busy_intervals_from_schedules, find_free_windows, parse_utc
+from agents.result_format import format_table
+
+# getSchedule accepts a limited number of mailboxes per call; larger groups are split and fetched concurrently
+GRAPH_SCHEDULE_CHUNK = 20
+
 
 class CalendarSkill:
     def __init__(self, graph_token: Optional[str]):
         if not graph_token:
             raise ValueError("GRAPH_ACCESS_TOKEN is required for CalendarSkill.")
         self.graph_token = graph_token
+        self._own_email: Optional[str] = None
+
+    @property
+    def graph(self) -> GraphClient:
+        # Looked up per use: the shared client for this account may have been closed and replaced
+        return get_graph_client(self.graph_token)
+
+    @property
+    def event_cache(self) -> CalendarEventCache:
+        return get_event_cache(self.graph)
 
     @kernel_function(name="create_event", description="Create a calendar event via Microsoft Graph API.")
     async def create_event(self, subject: str, start: str, end: str) -> str:
         body = {"subject": subject, "start": {"dateTime": start, "timeZone": "UTC"}, "end": {"dateTime": end, "timeZone": "UTC"}}
-        r = requests.post(
-            "https://graph.microsoft.com/v1.0/me/events",
-            headers={"Authorization": f"Bearer {self.graph_token}", "Content-Type": "application/json"},
-            json=body
-        )
+        r = await self.graph.post("/me/events", json=body)
         r.raise_for_status()
+        self.event_cache.invalidate()
         return f"Scheduled '{subject}' from {start} to {end}."
 
-    @kernel_function(name="find_free_slots", description="Find free calendar slots via Microsoft Graph API.")
-    async def find_free_slots(self, start_range: str, end_range: str, duration_minutes: int = 30) -> str:
-        req = {"schedules": ["me"], "startTime": {"dateTime": start_range, "timeZone": "UTC"},
-               "endTime": {"dateTime": end_range, "timeZone": "UTC"}, "availabilityViewInterval": duration_minutes}
-        r = requests.post(
-            "https://graph.microsoft.com/v1.0/me/calendar/getSchedule",
-            headers={"Authorization": f"Bearer {self.graph_token}", "Content-Type": "application/json"},
-            json=req
+    async def _own_address(self) -> str:
+        """Return the signed-in user's SMTP address (getSchedule needs addresses, not 'me')."""
+        if self._own_email is None:
+            r = await self.graph.get("/me", params={"$select": "mail,userPrincipalName"})
+            r.raise_for_status()
+            me = r.json()
+            self._own_email = me.get("mail") or me.get("userPrincipalName")
+        return self._own_email
+
+    async def _get_schedules(self, schedules: List[str], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Fetch scheduleItems for many mailboxes/rooms, GRAPH_SCHEDULE_CHUNK per getSchedule call, concurrently."""
+        time_format = "%Y-%m-%dT%H:%M:%S"
+
+        async def fetch(chunk: List[str]) -> List[Dict[str, Any]]:
+            req = {"schedules": chunk,
+                   "startTime": {"dateTime": start.strftime(time_format), "timeZone": "UTC"},
+                   "endTime": {"dateTime": end.strftime(time_format), "timeZone": "UTC"},
+                   "availabilityViewInterval": 15}
+            r = await self.graph.post("/me/calendar/getSchedule", json=req)
+            r.raise_for_status()
+            return r.json().get("value", [])
+
+        chunks = [schedules[i:i + GRAPH_SCHEDULE_CHUNK] for i in range(0, len(schedules), GRAPH_SCHEDULE_CHUNK)]
+        return [item for result in await asyncio.gather(*(fetch(c) for c in chunks)) for item in result]
+
+    @kernel_function(
+        name="find_free_slots",
+        description=(
+            "Find contiguous free time windows of at least duration_minutes that suit the user and, optionally, "
+            "other attendees and rooms (comma-separated email addresses). Returns the windows ranked earliest first."
         )
-        r.raise_for_status()
-        data = r.json().get("value", [])
-        slots = []
-        # Ensure start_range is parsed correctly for base datetime
-        try:
-            base = datetime.fromisoformat(start_range.replace("Z", "+00:00")) # Handle Z for UTC
-        except ValueError:
-             # Fallback if parsing fails, assuming it might be a different but valid ISO format
-            base = parser.isoparse(start_range)
-        
-        if base.tzinfo is None: # Ensure timezone awareness
-            base = base.replace(tzinfo=timezone.utc)
-
-        for sched in data:
-            view = sched.get("availabilityView", "")
-            for i, c in enumerate(view):
-                if c == '0': # '0' indicates free
-                    s = base + timedelta(minutes=i * duration_minutes)
-                    e = s + timedelta(minutes=duration_minutes)
-                    slots.append(f"{s.isoformat()} to {e.isoformat()}")
-        return ("Free slots:\n" + "\n".join(slots)) if slots else "No free slots found."
+    )
+    async def find_free_slots(self, start_range: str, end_range: str, duration_minutes: int = 30,
+                              attendees: Optional[str] = None, max_results: int = 10) -> str:
+        range_start = parse_utc(start_range)
+        range_end = parse_utc(end_range)
+        if range_end <= range_start:
+            return "The end of the range must be after its start."
+        if duration_minutes <= 0:
+            return "Error: The duration must be at least one minute."
+
+        schedules = [await self._own_address()]
+        if attendees:
+            schedules += [a.strip() for a in attendees.split(",") if a.strip() and a.strip() not in schedules]
+
+        data = await self._get_schedules(schedules, range_start, range_end)
+        unavailable = [sched.get("scheduleId", "?") for sched in data if "error" in sched]
+        busy = busy_intervals_from_schedules(sched for sched in data if "error" not in sched)
+        windows = find_free_windows(busy, range_start, range_end, timedelta(minutes=duration_minutes))
+
+        lines = []
+        if windows:
+            lines.append(format_table(
+                [{"start": s.isoformat(), "end": e.isoformat()} for s, e in windows[:max_results]],
+                columns=["start", "end"],
+                title=f"Free windows of at least {duration_minutes} minutes for {len(schedules) - len(unavailable)} calendar(s):",
+            ))
+            if len(windows) > max_results:
+                lines.append(f"...and {len(windows) - max_results} more.")
+        else:
+            lines.append("No free slots found.")
+        if unavailable:
+            lines.append(f"Could not read the schedules of: {', '.join(unavailable)}")
+        return "\n".join(lines)
     
     @kernel_function(
         name="cancel_events",
@@ -72,18 +120,8 @@ class CalendarSkill:
         end_range: str,
         subject: Optional[str] = None
     ) -> str:
-        params = {
-            "startDateTime": start_range,
-            "endDateTime":   end_range,
-            "$orderby":      "start/dateTime"
-        }
-        r = requests.get(
-            "https://graph.microsoft.com/v1.0/me/calendarView",
-            headers={"Authorization": f"Bearer {self.graph_token}", "Content-Type": "application/json"},
-            params=params
-        )
-        r.raise_for_status()
-        events = r.json().get("value", [])
+        # Served from the local event index, kept fresh with Graph delta queries
+        events = await self.event_cache.get_events(start_range, end_range)
         if not events:
             return "No events found in that time range."
 
@@ -99,24 +137,44 @@ class CalendarSkill:
         if not matches:
             return f"No events matching \"{subject}\" found between {start_range} and {end_range}."
 
-        deleted: List[str] = []
-        for ev in matches:
-            ev_id = ev["id"]
+        london_tz = tz.gettz("Europe/London")
+        labels: Dict[str, str] = {}
+        event_ids: Dict[str, str] = {}
+        batch_requests = []
+        for i, ev in enumerate(matches):
             start_utc = parser.isoparse(ev["start"]["dateTime"]).replace(tzinfo=timezone.utc)
-            london_tz = tz.gettz("Europe/London") # Corrected: tz.gettz()
             start_loc = start_utc.astimezone(london_tz).strftime("%Y-%m-%d %H:%M")
             subj = ev.get("subject", "(no subject)")
-            resp = requests.delete(
-                f"https://graph.microsoft.com/v1.0/me/events/{ev_id}",
-                headers={"Authorization": f"Bearer {self.graph_token}"}
-            )
-            if resp.status_code == 204:
-                deleted.append(f"\"{subj}\" at {start_loc}")
+            request_id = str(i + 1)
+            labels[request_id] = f"\"{subj}\" at {start_loc}"
+            event_ids[request_id] = ev["id"]
+            batch_requests.append({"id": request_id, "method": "DELETE", "url": f"/me/events/{ev['id']}"})
+
+        results = await self.graph.batch(batch_requests)
+
+        deleted: List[str] = []
+        failed: List[str] = []
+        deleted_ids: List[str] = []
+        for request_id, label in labels.items():
+            result = results.get(request_id)
+            status = result.get("status") if result else None
+            if status in (204, 404):
+                # 404 means the event is already gone, which is what the user asked for
+                deleted.append(label)
+                deleted_ids.append(event_ids[request_id])
             else:
-                resp.raise_for_status()
+                error = ((result or {}).get("body") or {}).get("error", {}).get("message", "no response")
+                failed.append(f"{label} ({status or 'error'}: {error})")
+
+        self.event_cache.remove_events(deleted_ids)
 
-        lines = ["Deleted the following events:"]
-        lines += [f"- {d}" for d in deleted]
+        lines = []
+        if deleted:
+            lines.append("Deleted the following events:")
+            lines += [f"- {d}" for d in deleted]
+        if failed:
+            lines.append("Could not delete the following events:")
+            lines += [f"- {f}" for f in failed]
         return "\n".join(lines)
     
     @kernel_function(
@@ -124,29 +182,19 @@ class CalendarSkill:
         description="List all calendar events in the given range, reporting subject and London-time start/end."
     )
     async def report_schedule(self, start_range: str, end_range: str) -> str:
-        params = {
-            "startDateTime": start_range,
-            "endDateTime":   end_range,
-            "$orderby":      "start/dateTime"
-        }
-        r = requests.get(
-            "https://graph.microsoft.com/v1.0/me/calendarView",
-            headers={"Authorization": f"Bearer {self.graph_token}", "Content-Type": "application/json"},
-            params=params
-        )
-        r.raise_for_status()
-        events = r.json().get("value", [])
+        # Served from the local event index, kept fresh with Graph delta queries
+        events = await self.event_cache.get_events(start_range, end_range)
         if not events:
             return "You have no events in that time range."
 
         london_tz = tz.gettz("Europe/London") # Corrected: tz.gettz()
-        lines = ["Your events:"]
+        rows = []
         for ev in events:
             subj = ev.get("subject", "(no subject)")
             start_utc = parser.isoparse(ev["start"]["dateTime"]).replace(tzinfo=timezone.utc) # Ensure UTC
             end_utc   = parser.isoparse(ev["end"]["dateTime"]).replace(tzinfo=timezone.utc)   # Ensure UTC
             start_loc = start_utc.astimezone(london_tz).strftime("%Y-%m-%d %H:%M")
             end_loc   = end_utc.astimezone(london_tz).strftime("%Y-%m-%d %H:%M")
-            lines.append(f"- {subj}: {start_loc} to {end_loc} (London time)")
+            rows.append({"subject": subj, "start": start_loc, "end": end_loc})
 
-        return "\n".join(lines)
+        return format_table(rows, columns=["subject", "start", "end"], title="Your events (London time):")
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+
+import httpx
+from dateutil import parser
+
+from agents.calendar.graph_client import UNKNOWN_ACCOUNT, GraphClient
+from agents.data_dir import data_path
+
+CALENDAR_CACHE_DB = os.getenv("CALENDAR_CACHE_DB") or data_path("calendar_cache.db")
+# Reads within this many seconds of the last delta sync are served purely from the local index
+CALENDAR_CACHE_REFRESH_SECONDS = float(os.getenv("CALENDAR_CACHE_REFRESH_SECONDS", "30"))
+
+_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def to_utc_key(value: str) -> str:
+    """Normalize an ISO timestamp (any offset, or naive UTC) to a sortable UTC string."""
+    parsed = parser.isoparse(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime(_TIME_FORMAT)
+
+
+def _event_time_key(event: Dict[str, Any], field: str) -> str:
+    # calendarView returns UTC times like '2024-05-01T09:00:00.0000000'
+    value = (event.get(field) or {}).get("dateTime", "")
+    return value[:19] if len(value) >= 19 else to_utc_key(value)
+
+
+def month_windows(start_key: str, end_key: str) -> List[Tuple[str, str]]:
+    """Split a UTC range into whole calendar-month sync windows covering it."""
+    start = datetime.strptime(start_key, _TIME_FORMAT)
+    end = datetime.strptime(end_key, _TIME_FORMAT)
+    windows = []
+    current = datetime(start.year, start.month, 1)
+    while current < end or not windows:
+        following = datetime(current.year + (current.month // 12), current.month % 12 + 1, 1)
+        windows.append((current.strftime(_TIME_FORMAT), following.strftime(_TIME_FORMAT)))
+        current = following
+    return windows
+
+
+class CalendarEventCache:
+    """Local SQLite index of calendar events kept fresh with Graph delta queries.
+
+    The calendar is tracked in whole-month windows. Each window is seeded with a paged
+    calendarView/delta query and afterwards only fetches changes through its stored
+    delta link, so repeated reads of the same range cost a local indexed query plus, at
+    most once every CALENDAR_CACHE_REFRESH_SECONDS, a small incremental round trip.
+
+    Each signed-in account gets its own cache (see get_event_cache). For opaque tokens,
+    which don't name their account, the index is dropped whenever the token changes
+    rather than risk serving another mailbox's events.
+    """
+
+    def __init__(self, graph: GraphClient, db_path: str = CALENDAR_CACHE_DB,
+                 refresh_seconds: float = CALENDAR_CACHE_REFRESH_SECONDS):
+        self.graph = graph
+        self.refresh_seconds = refresh_seconds
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " id TEXT PRIMARY KEY,"
+                " start_utc TEXT NOT NULL,"
+                " end_utc TEXT NOT NULL,"
+                " data TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_events_start_end ON events (start_utc, end_utc)")
+            # Which sync windows currently contain each event (an event can span months)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS event_windows ("
+                " event_id TEXT NOT NULL,"
+                " window_start TEXT NOT NULL,"
+                " PRIMARY KEY (event_id, window_start))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_windows ("
+                " window_start TEXT PRIMARY KEY,"
+                " window_end TEXT NOT NULL,"
+                " delta_link TEXT,"
+                " synced_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'token_fingerprint'").fetchone()
+        self._token_fingerprint = row[0] if row else None
+        self._check_token()
+
+    async def get_events(self, start: str, end: str) -> List[Dict[str, Any]]:
+        """Return Graph event objects overlapping [start, end), ordered by start time."""
+        self._check_token()
+        start_key, end_key = to_utc_key(start), to_utc_key(end)
+        windows = month_windows(start_key, end_key)
+        await asyncio.gather(*(self._refresh_window(w_start, w_end) for w_start, w_end in windows))
+        rows = self.conn.execute(
+            "SELECT data FROM events WHERE start_utc < ? AND end_utc > ? ORDER BY start_utc",
+            (end_key, start_key)
+        ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def _check_token(self):
+        fingerprint = self.graph.token_fingerprint
+        if fingerprint == self._token_fingerprint:
+            return
+        if self.graph.account == UNKNOWN_ACCOUNT and self._token_fingerprint is not None:
+            print("[CalendarEventCache] Access token changed and names no account; resyncing the calendar")
+            self.reset()
+        self._token_fingerprint = fingerprint
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('token_fingerprint', ?)", (fingerprint,)
+            )
+
+    def reset(self):
+        """Forget every cached event and delta link."""
+        with self.conn:
+            self.conn.execute("DELETE FROM events")
+            self.conn.execute("DELETE FROM event_windows")
+            self.conn.execute("DELETE FROM sync_windows")
+
+    def invalidate(self):
+        """Force the next read of every window to fetch changes from Graph (e.g. after a write)."""
+        with self.conn:
+            self.conn.execute("UPDATE sync_windows SET synced_at = 0")
+
+    def remove_events(self, event_ids: Iterable[str]):
+        """Drop events known to be deleted without waiting for the next delta sync."""
+        ids = [(event_id,) for event_id in event_ids]
+        with self.conn:
+            self.conn.executemany("DELETE FROM events WHERE id = ?", ids)
+            self.conn.executemany("DELETE FROM event_windows WHERE event_id = ?", ids)
+
+    async def _refresh_window(self, window_start: str, window_end: str):
+        lock = self._locks.setdefault(window_start, asyncio.Lock())
+        async with lock:
+            row = self.conn.execute(
+                "SELECT delta_link, synced_at FROM sync_windows WHERE window_start = ?", (window_start,)
+            ).fetchone()
+            if row is not None and time.time() - row[1] < self.refresh_seconds:
+                return
+
+            delta_link = row[0] if row else None
+            try:
+                if delta_link:
+                    payload = await self.graph.get_all_pages(delta_link)
+                else:
+                    payload = await self._initial_sync(window_start, window_end)
+            except httpx.HTTPStatusError as e:
+                if delta_link and e.response.status_code in (400, 410):
+                    # Delta token expired or invalid - reseed the window from scratch
+                    print(f"[CalendarEventCache] Delta link for window {window_start} expired, resyncing")
+                    self._clear_window(window_start)
+                    payload = await self._initial_sync(window_start, window_end)
+                else:
+                    raise
+
+            self._apply_changes(window_start, window_end, payload)
+
+    async def _initial_sync(self, window_start: str, window_end: str) -> Dict[str, Any]:
+        params = {"startDateTime": f"{window_start}Z", "endDateTime": f"{window_end}Z"}
+        return await self.graph.get_all_pages("/me/calendarView/delta", params=params)
+
+    def _clear_window(self, window_start: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM event_windows WHERE window_start = ?", (window_start,))
+            self.conn.execute("DELETE FROM sync_windows WHERE window_start = ?", (window_start,))
+            self._delete_orphans()
+
+    def _apply_changes(self, window_start: str, window_end: str, payload: Dict[str, Any]):
+        with self.conn:
+            for event in payload.get("value", []):
+                event_id = event.get("id")
+                if not event_id:
+                    continue
+                if "@removed" in event:
+                    self.conn.execute(
+                        "DELETE FROM event_windows WHERE event_id = ? AND window_start = ?", (event_id, window_start)
+                    )
+                    continue
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO events (id, start_utc, end_utc, data) VALUES (?, ?, ?, ?)",
+                    (event_id, _event_time_key(event, "start"), _event_time_key(event, "end"), json.dumps(event))
+                )
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO event_windows (event_id, window_start) VALUES (?, ?)",
+                    (event_id, window_start)
+                )
+            self._delete_orphans()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_windows (window_start, window_end, delta_link, synced_at) VALUES (?, ?, ?, ?)",
+                (window_start, window_end, payload.get("@odata.deltaLink"), time.time())
+            )
+
+    def _delete_orphans(self):
+        # Caller must be inside a transaction
+        self.conn.execute("DELETE FROM events WHERE id NOT IN (SELECT event_id FROM event_windows)")
+
+
+_caches: Dict[str, CalendarEventCache] = {}
+_caches_lock = threading.Lock()
+
+
+def cache_db_path(account: str) -> str:
+    """SQLite file for an account's events: CALENDAR_CACHE_DB, suffixed for named accounts."""
+    if account == UNKNOWN_ACCOUNT:
+        return CALENDAR_CACHE_DB
+    base, ext = os.path.splitext(CALENDAR_CACHE_DB)
+    return f"{base}-{hashlib.sha256(account.encode()).hexdigest()[:12]}{ext}"
+
+
+def get_event_cache(graph: GraphClient) -> CalendarEventCache:
+    """Return the event cache for the mailbox the client is signed in to."""
+    with _caches_lock:
+        cache = _caches.get(graph.account)
+        if cache is None:
+            cache = _caches[graph.account] = CalendarEventCache(graph, db_path=cache_db_path(graph.account))
+        else:
+            # get_graph_client may have replaced the account's client; always sync through the current one
+            cache.graph = graph
+        return cache
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Ordered rules table: the first category whose keyword appears anywhere in the
+# subject (case-insensitive substring) wins. Events matching nothing get the default.
+DEFAULT_CATEGORY_RULES: List[Tuple[str, List[str]]] = [
+    ("task", ["task", "todo"]),
+    ("reminder", ["reminder"]),
+    ("social", ["lunch", "dinner", "social"]),
+]
+DEFAULT_CATEGORY = "meeting"
+
+
+def load_category_rules(path: Optional[str] = None) -> List[Tuple[str, List[str]]]:
+    """Load rules from a JSON file of [[category, [keyword, ...]], ...] (CALENDAR_CATEGORY_RULES_FILE)."""
+    path = path or os.getenv("CALENDAR_CATEGORY_RULES_FILE")
+    if not path:
+        return DEFAULT_CATEGORY_RULES
+    try:
+        with open(path) as f:
+            return [(category, list(keywords)) for category, keywords in json.load(f)]
+    except (OSError, ValueError, TypeError) as e:
+        print(f"[EventCategorizer] Could not load category rules from {path}: {e}. Using defaults.")
+        return DEFAULT_CATEGORY_RULES
+
+
+class EventCategorizer:
+    """Categorizes event subjects with a single compiled pattern built from a rules table."""
+
+    def __init__(self, rules: Sequence[Tuple[str, Sequence[str]]] = DEFAULT_CATEGORY_RULES,
+                 default_category: str = DEFAULT_CATEGORY):
+        self.default_category = default_category
+        # keyword -> (rule priority, category); earlier rules win, as do earlier keywords
+        self._keywords: Dict[str, Tuple[int, str]] = {}
+        for priority, (category, keywords) in enumerate(rules):
+            for keyword in keywords:
+                self._keywords.setdefault(keyword.lower(), (priority, category))
+        # Longest keywords first so overlapping keywords resolve to the more specific one
+        alternation = "|".join(re.escape(k) for k in sorted(self._keywords, key=len, reverse=True))
+        self._pattern = re.compile(alternation, re.IGNORECASE) if alternation else None
+        # Identifies the rules table, e.g. so HTTP caches are invalidated when the rules change
+        self.fingerprint = hashlib.sha1(
+            json.dumps([default_category, sorted(self._keywords.items())]).encode()
+        ).hexdigest()[:12]
+        # Recurring events repeat the same subjects, so memoize per subject
+        self.categorize = lru_cache(maxsize=4096)(self._categorize)
+
+    def _categorize(self, subject: str) -> str:
+        if not subject or self._pattern is None:
+            return self.default_category
+        matches = self._pattern.findall(subject)
+        if not matches:
+            return self.default_category
+        return min(self._keywords[m.lower()] for m in matches)[1]
+
+    def transform(self, ms_events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Convert Graph event objects into the compact shape the UI calendar expects."""
+        categorize = self.categorize
+        return [
+            {
+                "id": ev.get("id", ""),
+                "title": ev.get("subject", "(No title)"),
+                "description": ev.get("bodyPreview", ""),
+                "start": (ev.get("start") or {}).get("dateTime", ""),
+                "end": (ev.get("end") or {}).get("dateTime", ""),
+                "category": categorize(ev.get("subject") or ""),
+            }
+            for ev in ms_events
+        ]
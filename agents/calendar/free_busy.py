@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+
+from dateutil import parser
+
+Interval = Tuple[datetime, datetime]
+
+# getSchedule statuses that block a meeting. 'tentative' is treated as busy so
+# suggested slots don't collide with unanswered invitations.
+BUSY_STATUSES = {"busy", "oof", "tentative", "workingElsewhere"}
+
+
+def parse_utc(value: str) -> datetime:
+    """Parse a Graph/ISO timestamp into an aware UTC datetime (naive values are taken as UTC)."""
+    parsed = parser.isoparse(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def busy_intervals_from_schedules(schedules: Iterable[Dict[str, Any]],
+                                  busy_statuses=BUSY_STATUSES) -> List[Interval]:
+    """Collect busy intervals from the 'value' entries of a getSchedule response."""
+    intervals: List[Interval] = []
+    for schedule in schedules:
+        for item in schedule.get("scheduleItems", []):
+            if item.get("status") not in busy_statuses:
+                continue
+            start = parse_utc(item["start"]["dateTime"])
+            end = parse_utc(item["end"]["dateTime"])
+            if end > start:
+                intervals.append((start, end))
+    return intervals
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Merge overlapping or touching intervals with a single sorted sweep."""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def find_free_windows(busy: Iterable[Interval], range_start: datetime, range_end: datetime,
+                      duration: timedelta, rank_by: str = "earliest") -> List[Interval]:
+    """Return the contiguous free windows in [range_start, range_end) at least `duration` long.
+
+    Busy intervals from any number of attendees are merged first, so the result is the
+    time everyone is free. rank_by='earliest' orders windows by start time,
+    rank_by='longest' puts the roomiest windows first.
+    """
+    if duration <= timedelta(0):
+        raise ValueError("duration must be positive")
+    windows: List[Interval] = []
+    cursor = range_start
+    for start, end in merge_intervals(busy):
+        if end <= cursor:
+            continue
+        if start >= range_end:
+            break
+        if start - cursor >= duration:
+            windows.append((cursor, start))
+        cursor = max(cursor, end)
+    if range_end - cursor >= duration:
+        windows.append((cursor, range_end))
+
+    if rank_by == "longest":
+        windows.sort(key=lambda w: (-(w[1] - w[0]), w[0]))
+    return windows
@@ -0,0 +1,258 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from agents.event_loop import get_background_loop
+
+# Override to point the client at a local mock Graph server (e.g. http://localhost:8081/v1.0)
+GRAPH_BASE_URL = os.getenv("GRAPH_API_BASE_URL", "https://graph.microsoft.com/v1.0")
+GRAPH_TIMEOUT_SECONDS = float(os.getenv("GRAPH_TIMEOUT_SECONDS", "15"))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "4"))
+GRAPH_MAX_CONNECTIONS = int(os.getenv("GRAPH_MAX_CONNECTIONS", "20"))
+# Signed-in accounts whose clients are kept open; the least recently used one is closed beyond this
+GRAPH_MAX_CLIENTS = int(os.getenv("GRAPH_MAX_CLIENTS", "8"))
+# Account key for tokens that carry no readable identity (opaque, non-JWT tokens)
+UNKNOWN_ACCOUNT = "default"
+
+# Graph JSON batching accepts at most 20 requests per $batch call, and throttles
+# more than 4 concurrent requests against the same mailbox
+GRAPH_BATCH_LIMIT = 20
+GRAPH_BATCH_CONCURRENCY = 4
+
+# Throttling and transient gateway errors worth retrying
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# POST/PATCH may have been applied before a 502/504 or a read timeout, so replaying them could
+# duplicate the change (e.g. create an event twice). They are retried only when Graph rejected
+# the request outright or it never left the client.
+UNSAFE_RETRYABLE_STATUS_CODES = {429, 503}
+UNSENT_REQUEST_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class GraphClient:
+    """Async Microsoft Graph client with connection pooling, timeouts and retry.
+
+    Idempotent requests that come back 429/502/503/504 (or fail at the transport level) are
+    retried with exponential backoff, honouring the Retry-After header when Graph sends one.
+    POST/PATCH are retried only on 429/503 and on errors before the request was sent.
+    Responses are httpx.Response objects, so callers use raise_for_status()/json() as before.
+    """
+
+    def __init__(self, token: str, base_url: str = GRAPH_BASE_URL, timeout: float = GRAPH_TIMEOUT_SECONDS,
+                 max_retries: int = GRAPH_MAX_RETRIES, max_connections: int = GRAPH_MAX_CONNECTIONS,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.account = token_account(token)
+        self.token_fingerprint = _fingerprint(token)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    def set_token(self, token: str):
+        """Use a refreshed token for the same account, keeping the connection pool."""
+        self._client.headers["Authorization"] = f"Bearer {token}"
+        self.token_fingerprint = _fingerprint(token)
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """Send a request relative to the Graph base URL (absolute URLs such as nextLinks also work)."""
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_errors = httpx.TransportError if idempotent else UNSENT_REQUEST_ERRORS
+        retry_statuses = RETRYABLE_STATUS_CODES if idempotent else UNSAFE_RETRYABLE_STATUS_CODES
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except retry_errors as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"[GraphClient] {method} {path} failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after(response) or self._backoff(attempt)
+                print(f"[GraphClient] {method} {path} returned {response.status_code}, retrying in {delay:.1f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        return await self.request("GET", path, params=params)
+
+    async def post(self, path: str, json: Optional[Any] = None) -> httpx.Response:
+        return await self.request("POST", path, json=json)
+
+    async def delete(self, path: str) -> httpx.Response:
+        return await self.request("DELETE", path)
+
+    async def get_all_pages(self, path: str, params: Optional[Dict[str, Any]] = None,
+                            page_size: int = 200) -> Dict[str, Any]:
+        """Fetch a collection, following @odata.nextLink until the last page.
+
+        Returns {"value": [...all items...], "@odata.deltaLink": ...} where the delta link
+        is only present for delta queries.
+        """
+        headers = {"Prefer": f"odata.maxpagesize={page_size}"}
+        items: List[Dict[str, Any]] = []
+        url: Optional[str] = path
+        request_params = params
+        while url:
+            response = await self.request("GET", url, params=request_params, headers=headers)
+            response.raise_for_status()
+            payload = response.json()
+            items.extend(payload.get("value", []))
+            url = payload.get("@odata.nextLink")
+            request_params = None  # nextLink already carries the query string
+        result = {"value": items}
+        if "@odata.deltaLink" in payload:
+            result["@odata.deltaLink"] = payload["@odata.deltaLink"]
+        return result
+
+    async def batch(self, requests: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Send requests through Graph JSON batching, GRAPH_BATCH_LIMIT per $batch call.
+
+        Each request is a dict with 'id', 'method' and 'url' (relative to the version root,
+        e.g. '/me/events/{id}') plus optional 'body'/'headers'. Returns the individual
+        responses keyed by request id ({'id', 'status', 'headers', 'body'}). Sub-requests
+        throttled with 429/503 are retried after their Retry-After delay. If a whole $batch
+        call fails (after the client's own retries), each of its sub-requests is reported
+        with that call's status code (None for transport errors), so other chunks' results survive.
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = list(requests)
+        semaphore = asyncio.Semaphore(GRAPH_BATCH_CONCURRENCY)
+
+        def failed_chunk(chunk: List[Dict[str, Any]], status: Optional[int], message: str) -> List[Dict[str, Any]]:
+            return [
+                {"id": req["id"], "status": status, "headers": {}, "body": {"error": {"message": message}},
+                 "batch_failed": True}
+                for req in chunk
+            ]
+
+        async def send_chunk(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    response = await self.post("/$batch", json={"requests": chunk})
+                except httpx.HTTPError as e:
+                    print(f"[GraphClient] $batch call failed: {e}")
+                    return failed_chunk(chunk, None, str(e))
+                if response.is_error:
+                    print(f"[GraphClient] $batch call returned {response.status_code}")
+                    return failed_chunk(chunk, response.status_code, f"$batch call failed: {response.text[:200]}")
+                return response.json().get("responses", [])
+
+        for attempt in range(self.max_retries + 1):
+            chunks = [pending[i:i + GRAPH_BATCH_LIMIT] for i in range(0, len(pending), GRAPH_BATCH_LIMIT)]
+            responses = [r for chunk_responses in await asyncio.gather(*(send_chunk(c) for c in chunks))
+                         for r in chunk_responses]
+
+            throttled_ids = set()
+            delay = 0.0
+            for r in responses:
+                results[r["id"]] = r
+                # Failed $batch calls were already retried by request(); only retry throttled sub-requests
+                if r.get("status") in (429, 503) and not r.get("batch_failed"):
+                    throttled_ids.add(r["id"])
+                    retry_after = (r.get("headers") or {}).get("Retry-After")
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except (TypeError, ValueError):
+                        delay = max(delay, self._backoff(attempt))
+
+            pending = [req for req in pending if req["id"] in throttled_ids]
+            if not pending or attempt >= self.max_retries:
+                break
+            delay = min(MAX_BACKOFF_SECONDS, delay)
+            print(f"[GraphClient] {len(pending)} batched requests throttled, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        return results
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(MAX_BACKOFF_SECONDS, (2 ** attempt) * 0.5 + random.uniform(0, 0.5))
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return min(MAX_BACKOFF_SECONDS, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return min(MAX_BACKOFF_SECONDS, max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds()))
+        except (TypeError, ValueError):
+            return None
+
+
+def _fingerprint(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def token_account(token: str) -> str:
+    """The account a token was issued for (its oid/upn claim), or UNKNOWN_ACCOUNT for opaque tokens.
+
+    The claims are only read to key caches; Graph still validates the token itself.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        account = claims.get("oid") or claims.get("upn") or claims.get("preferred_username")
+    except (IndexError, ValueError, AttributeError):
+        return UNKNOWN_ACCOUNT
+    return str(account) if account else UNKNOWN_ACCOUNT
+
+
+def _close_later(client: GraphClient):
+    # The pool belongs to whichever loop used it: the caller's, or the shared background loop
+    try:
+        asyncio.get_running_loop().create_task(client.aclose())
+    except RuntimeError:
+        get_background_loop().submit(client.aclose())
+
+
+_clients: "OrderedDict[str, GraphClient]" = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def get_graph_client(token: str) -> GraphClient:
+    """Return the shared GraphClient for the token's account, so callers reuse one connection pool.
+
+    A refreshed token for an account already seen is swapped into its existing client.
+    """
+    account = token_account(token)
+    evicted: List[GraphClient] = []
+    with _clients_lock:
+        client = _clients.get(account)
+        if client is None:
+            client = GraphClient(token)
+            _clients[account] = client
+            while len(_clients) > GRAPH_MAX_CLIENTS:
+                evicted.append(_clients.popitem(last=False)[1])
+        elif client.token_fingerprint != _fingerprint(token):
+            client.set_token(token)
+        _clients.move_to_end(account)
+    for stale in evicted:
+        _close_later(stale)
+    return client
@@ -0,0 +1,12 @@
+import os
+
+# Local state (SQLite caches, queues, chat history) lives here unless a store's own path variable is set
+CAMPUS_DATA_DIR = os.getenv(
+    "CAMPUS_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+)
+
+
+def data_path(filename: str) -> str:
+    """Path of a file in the data directory, creating the directory if needed."""
+    os.makedirs(CAMPUS_DATA_DIR, exist_ok=True)
+    return os.path.join(CAMPUS_DATA_DIR, filename)
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Optional
+
+
+class BackgroundEventLoop:
+    """A single long-lived asyncio event loop running in a daemon thread.
+
+    Synchronous callers (e.g. Flask request handlers) submit coroutines to this loop
+    instead of calling asyncio.run() per request, so async clients created by the agents
+    (httpx/aiohttp pools inside AzureChatCompletion) stay bound to one loop and keep
+    their connections warm between requests.
+    """
+
+    def __init__(self, name: str = "agents-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+
+    def submit(self, coro: Awaitable[Any]) -> "asyncio.Future":
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block the calling thread until it finishes."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    def is_running(self) -> bool:
+        return self.loop.is_running()
+
+    def stop(self):
+        """Stop the loop and wait for the thread to exit."""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+
+
+_background_loop: Optional[BackgroundEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """Return the process-wide background event loop, starting it on first use."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or not _background_loop.is_running():
+            _background_loop = BackgroundEventLoop()
+        return _background_loop
@@ -0,0 +1,204 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.contents import ChatHistory, ChatMessageContent
+
+from agents.token_count import count_tokens
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a campus assistant and a user. "
+    "Update the existing summary with the new messages. Keep names, dates, times, rooms, event names, "
+    "decisions and open requests; drop pleasantries. Reply with the updated summary only, in at most {max_words} words."
+)
+
+# Per-message overhead of the chat format (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _with_seq(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Session stores number their messages; a plain growing list (the CLI) is numbered by position
+    return [entry if "seq" in entry else {**entry, "seq": index} for index, entry in enumerate(history)]
+
+
+class _SummaryState:
+    def __init__(self):
+        self.summary = ""
+        self.folded_upto = -1  # Sequence number of the newest message folded into the summary
+        self.retired: List[Dict[str, Any]] = []  # Dropped from the session store, not yet folded
+        self.folding = False  # A background fold is running
+
+
+class HistoryManager:
+    """Builds the message list sent to the triage agent within a token budget.
+
+    The most recent messages are kept verbatim while they fit in `max_history_tokens`
+    (at least `min_recent_messages` of them are always kept). Older messages, and
+    messages the session store has dropped (see `retire`), are folded into a rolling
+    summary that is cached per session. Folding is tracked by message sequence number,
+    so each message is summarized once and unchanged history costs no extra model calls.
+
+    Folding runs in the background: a turn uses the cached summary plus the few messages
+    not folded yet (verbatim), and only waits for the model when that backlog exceeds
+    `max_unfolded_tokens`.
+    """
+
+    def __init__(
+        self,
+        service: Optional[AzureChatCompletion],
+        max_history_tokens: int = 3000,
+        min_recent_messages: int = 4,
+        summary_max_tokens: int = 300,
+        max_sessions: int = 1000,
+        max_unfolded_tokens: int = 1500,
+    ):
+        self.service = service
+        self.max_history_tokens = max_history_tokens
+        self.min_recent_messages = min_recent_messages
+        self.summary_max_tokens = summary_max_tokens
+        self.max_sessions = max_sessions
+        self.max_unfolded_tokens = max_unfolded_tokens
+        self._folds: set = set()  # Running background folds, referenced so they aren't garbage collected
+        self._summaries: "OrderedDict[str, _SummaryState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, session_id: str) -> _SummaryState:
+        # Caller must hold the lock
+        state = self._summaries.get(session_id)
+        if state is None:
+            state = self._summaries[session_id] = _SummaryState()
+            while len(self._summaries) > self.max_sessions:
+                self._summaries.popitem(last=False)
+        self._summaries.move_to_end(session_id)
+        return state
+
+    def retire(self, session_id: str, messages: List[Dict[str, Any]]):
+        """Queue messages that fell out of the session store so the next summary still covers them."""
+        with self._lock:
+            state = self._state(session_id)
+            state.retired.extend(m for m in messages if m.get("seq", -1) > state.folded_upto)
+
+    def split_history(self, history: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """Split history into (older, recent) where recent fits in the token budget."""
+        used = 0
+        keep = 0
+        for entry in reversed(history):
+            tokens = count_tokens(entry.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+            if keep >= self.min_recent_messages and used + tokens > self.max_history_tokens:
+                break
+            used += tokens
+            keep += 1
+        split_at = len(history) - keep
+        # Never start the verbatim window on an assistant reply without its question
+        if 0 < split_at < len(history) and history[split_at].get("role") == "assistant":
+            split_at += 1
+        return history[:split_at], history[split_at:]
+
+    def _unfolded(self, session_id: str, older: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """The cached summary and the retired or `older` messages it does not cover yet, oldest first."""
+        with self._lock:
+            state = self._summaries.get(session_id)
+            if state is None and not older:
+                return "", []
+            state = self._state(session_id)
+            unfolded = {m["seq"]: m for m in state.retired + older if m["seq"] > state.folded_upto}
+            return state.summary, [unfolded[seq] for seq in sorted(unfolded)]
+
+    async def get_summary(self, session_id: str, older: List[Dict[str, Any]]) -> str:
+        """Return the rolling summary, folding in any retired or `older` messages not summarized yet."""
+        previous_summary, new_messages = self._unfolded(session_id, older)
+        if not new_messages:
+            return previous_summary
+        with self._lock:
+            state = self._state(session_id)
+
+        summary = await self._summarize(previous_summary, new_messages)
+        with self._lock:
+            if self._summaries.get(session_id) is not state:
+                # Cleared (or evicted) while summarizing; don't resurrect it
+                return summary
+            newest = new_messages[-1]["seq"]
+            if newest > state.folded_upto:
+                state.summary = summary
+                state.folded_upto = newest
+            state.retired = [m for m in state.retired if m["seq"] > state.folded_upto]
+            return state.summary
+
+    async def _summarize(self, previous_summary: str, messages: List[Dict[str, str]]) -> str:
+        transcript = "\n".join(f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages)
+        if self.service is None:
+            return self._truncate((previous_summary + "\n" + transcript).strip())
+
+        chat_history = ChatHistory()
+        chat_history.add_system_message(SUMMARY_INSTRUCTIONS.format(max_words=int(self.summary_max_tokens * 0.75)))
+        chat_history.add_user_message(
+            f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        try:
+            settings = self.service.get_prompt_execution_settings_class()(max_tokens=self.summary_max_tokens)
+            result = await self.service.get_chat_message_content(chat_history=chat_history, settings=settings)
+            if result is not None and result.content:
+                return str(result.content).strip()
+        except Exception as e:
+            print(f"[HistoryManager] Failed to summarize conversation history: {e}")
+        # Keep going without a model summary rather than failing the user's turn
+        return self._truncate((previous_summary + "\n" + transcript).strip())
+
+    def _truncate(self, text: str) -> str:
+        max_chars = self.summary_max_tokens * 4
+        return text if len(text) <= max_chars else "..." + text[-max_chars:]
+
+    async def build_messages(
+        self, session_id: str, history: List[Dict[str, str]], current_user_message: str
+    ) -> List[ChatMessageContent]:
+        """Return ChatMessageContent objects for the triage agent: summary, recent turns, current message."""
+        older, recent = self.split_history(_with_seq(history))
+        messages: List[ChatMessageContent] = []
+
+        summary, unfolded = self._unfolded(session_id, older)
+        if unfolded:
+            backlog = sum(count_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in unfolded)
+            if backlog > self.max_unfolded_tokens:
+                # Background folding has fallen behind; catch up before this turn
+                summary, unfolded = await self.get_summary(session_id, older), []
+            else:
+                self._fold_in_background(session_id, older)
+        if summary:
+            messages.append(ChatMessageContent(role="system", content=f"Summary of the earlier conversation:\n{summary}"))
+
+        # Messages the summary doesn't cover yet go in verbatim, ahead of the recent ones
+        for entry in unfolded + recent:
+            try:
+                messages.append(ChatMessageContent(role=entry["role"], content=entry["content"]))
+            except KeyError:
+                print(f"Warning: Skipping history entry due to missing 'role' or 'content': {entry}")
+                continue
+
+        messages.append(ChatMessageContent(role="user", content=current_user_message))
+        return messages
+
+    def _fold_in_background(self, session_id: str, older: List[Dict[str, Any]]):
+        with self._lock:
+            state = self._state(session_id)
+            if state.folding:
+                return
+            state.folding = True
+
+        async def fold():
+            try:
+                await self.get_summary(session_id, older)
+            except Exception as e:
+                print(f"[HistoryManager] Background summary failed: {e}")
+            finally:
+                with self._lock:
+                    state.folding = False
+
+        task = asyncio.get_running_loop().create_task(fold())
+        self._folds.add(task)
+        task.add_done_callback(self._folds.discard)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._summaries.pop(session_id, None)
@@ -0,0 +1,148 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents.iot.telemetry_cache import format_timestamp
+
+# Smoothing factor of the EWMA baseline (higher reacts faster)
+ANOMALY_EWMA_ALPHA = float(os.getenv("IOT_ANOMALY_EWMA_ALPHA", "0.05"))
+# Readings a baseline needs before it is trusted to flag anything
+ANOMALY_MIN_SAMPLES = int(os.getenv("IOT_ANOMALY_MIN_SAMPLES", "30"))
+# Readings scoring below this are not kept at all, so it is also the lowest threshold get_anomalies can honour
+ANOMALY_STORE_THRESHOLD = float(os.getenv("IOT_ANOMALY_STORE_THRESHOLD", "2.0"))
+# Flagged readings are kept per sensor for this long, at most ANOMALY_HISTORY_PER_SENSOR of them
+ANOMALY_RETENTION_SECONDS = float(os.getenv("IOT_ANOMALY_RETENTION_HOURS", "24")) * 3600
+ANOMALY_HISTORY_PER_SENSOR = int(os.getenv("IOT_ANOMALY_HISTORY_PER_SENSOR", "256"))
+
+
+class _Baseline:
+    """Exponentially weighted mean and variance, updated one reading at a time."""
+
+    __slots__ = ("mean", "var", "count")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    def score(self, value: float) -> Optional[float]:
+        if self.count < ANOMALY_MIN_SAMPLES:
+            return None
+        std = math.sqrt(self.var)
+        if std < 1e-9:
+            return 0.0 if abs(value - self.mean) < 1e-9 else math.inf
+        return (value - self.mean) / std
+
+    def update(self, value: float, alpha: float):
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            return
+        # Warm up with a plain running average so early readings don't dominate
+        a = max(alpha, 1.0 / self.count)
+        diff = value - self.mean
+        increment = a * diff
+        self.mean += increment
+        self.var = (1 - a) * (self.var + diff * increment)
+
+
+class _SensorState:
+    __slots__ = ("ewma", "hourly", "flagged")
+
+    def __init__(self):
+        self.ewma = _Baseline()
+        # Seasonal baseline: one EWMA per hour of the day (UTC)
+        self.hourly: List[_Baseline] = [_Baseline() for _ in range(24)]
+        # This sensor's flagged readings, oldest first
+        self.flagged: List[Dict[str, Any]] = []
+
+    def flag(self, anomaly: Dict[str, Any], capacity: int, retention: float):
+        expired = anomaly["timestamp"] - retention
+        if self.flagged and self.flagged[0]["timestamp"] < expired:
+            self.flagged = [a for a in self.flagged if a["timestamp"] >= expired]
+        if len(self.flagged) >= capacity:
+            # Full within the retention window: drop the weakest (oldest on ties), never a stronger one
+            weakest = min(range(len(self.flagged)), key=lambda i: abs(self.flagged[i]["z"]))
+            if abs(self.flagged[weakest]["z"]) > abs(anomaly["z"]):
+                return
+            del self.flagged[weakest]
+        self.flagged.append(anomaly)
+
+
+class AnomalyDetector:
+    """Online anomaly detection over every (device, metric) stream.
+
+    Each reading is scored against its sensor's hour-of-day seasonal baseline when that
+    baseline has enough history, otherwise against the overall EWMA baseline, and only
+    then folded into both. Readings with |z| >= ANOMALY_STORE_THRESHOLD are remembered
+    per sensor so get_anomalies() is a scan over short lists rather than over raw telemetry;
+    a busy sensor can only displace its own weaker flags, never another sensor's.
+    """
+
+    def __init__(self, alpha: float = ANOMALY_EWMA_ALPHA, history_per_sensor: int = ANOMALY_HISTORY_PER_SENSOR,
+                 retention_seconds: float = ANOMALY_RETENTION_SECONDS):
+        self.alpha = alpha
+        self.history_per_sensor = history_per_sensor
+        self.retention_seconds = retention_seconds
+        self.sensors: Dict[Tuple[str, str], _SensorState] = {}
+        self._lock = threading.Lock()
+
+    def update(self, device_id: str, timestamp: float, values: Dict[str, float]):
+        """Score and absorb one reading. Signature matches TelemetryCache listeners."""
+        hour = datetime.fromtimestamp(timestamp, tz=timezone.utc).hour
+        with self._lock:
+            for metric, value in values.items():
+                if math.isnan(value):
+                    continue
+                state = self.sensors.get((device_id, metric))
+                if state is None:
+                    state = self.sensors[(device_id, metric)] = _SensorState()
+
+                seasonal = state.hourly[hour]
+                z = seasonal.score(value)
+                kind = "seasonal"
+                if z is None:
+                    z = state.ewma.score(value)
+                    kind = "ewma"
+
+                if z is not None and abs(z) >= ANOMALY_STORE_THRESHOLD:
+                    state.flag({
+                        "timestamp": timestamp,
+                        "device": device_id,
+                        "metric": metric,
+                        "value": round(value, 2),
+                        "expected": round(seasonal.mean if kind == "seasonal" else state.ewma.mean, 2),
+                        "z": round(z, 2) if math.isfinite(z) else z,
+                        "baseline": kind,
+                    }, self.history_per_sensor, self.retention_seconds)
+
+                state.ewma.update(value, self.alpha)
+                seasonal.update(value, self.alpha)
+
+    def get_anomalies(self, window_seconds: float, threshold: float, device_id: Optional[str] = None,
+                      metric: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Flagged readings from the last window_seconds with |z| >= threshold, strongest first.
+
+        Thresholds below ANOMALY_STORE_THRESHOLD match the same readings as the floor itself;
+        callers should clamp and say so. Windows reach back at most retention_seconds.
+        """
+        since = time.time() - min(window_seconds, self.retention_seconds)
+        with self._lock:
+            matches = [
+                a for (device, name), state in self.sensors.items()
+                if (device_id is None or device == device_id) and (metric is None or name == metric)
+                for a in state.flagged
+                if a["timestamp"] >= since and abs(a["z"]) >= threshold
+            ]
+        matches.sort(key=lambda a: abs(a["z"]), reverse=True)
+        return [
+            {**a, "timestamp": format_timestamp(a["timestamp"]), "z": a["z"] if math.isfinite(a["z"]) else "inf"}
+            for a in matches[:limit]
+        ]
+
+    def sensor_count(self) -> int:
+        with self._lock:
+            return len(self.sensors)
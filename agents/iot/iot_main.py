@@ -6,6 +6,7 @@ from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.agents import ChatCompletionAgent
 
 from agents.base_agent import BaseAgent
+from agents.iot.anomaly_detector import ANOMALY_STORE_THRESHOLD
 from agents.iot.iot_skills import IoTDataSkill
 
 class IoTAgent(BaseAgent):
@@ -31,7 +32,8 @@ class IoTAgent(BaseAgent):
             "azure_openai_api_version": os.getenv("AZURE_OPENAI_API_VERSION", "2024-12-01-preview"),
             "cosmos_connection_string": os.getenv("AZURE_COSMOS_CONNECTION_STRING"),
             "cosmos_db_name": os.getenv("COSMOS_DB_NAME"),
-            "cosmos_container_name": os.getenv("COSMOS_CONTAINER_NAME")
+            "cosmos_container_name": os.getenv("COSMOS_CONTAINER_NAME"),
+            "telemetry_cache_enabled": os.getenv("IOT_TELEMETRY_CACHE", "true").lower() == "true"
         }
 
     def _validate_configuration(self, config: Dict[str, str]):
@@ -53,16 +55,12 @@ class IoTAgent(BaseAgent):
                 "environment variables for the IoT agent.\n"
             )
         
-        kernel = Kernel()
-        az_service = AzureChatCompletion(
-            service_id=f"{self.get_agent_name().lower()}_chat_service",
-            api_key=config["azure_openai_api_key"],
+        return self.create_kernel_and_service(
             endpoint=config["azure_openai_api_endpoint"],
+            api_key=config["azure_openai_api_key"],
             deployment_name=config["azure_openai_deployment_name"],
             api_version=config["azure_openai_api_version"]
         )
-        kernel.add_service(az_service)
-        return kernel, az_service
 
     def initialize_skills(self, config: Dict[str, Optional[str]], kernel: Kernel) -> List[Any]:
         """Initialize and return the IoTDataPlugin if possible."""
@@ -72,7 +70,8 @@ class IoTAgent(BaseAgent):
                 iot_plugin = IoTDataSkill(
                     config["cosmos_connection_string"],
                     config["cosmos_db_name"],
-                    config["cosmos_container_name"]
+                    config["cosmos_container_name"],
+                    use_cache=config["telemetry_cache_enabled"]
                 )
                 kernel.add_plugin(plugin=iot_plugin, plugin_name="IoTPlugin")
                 skills.append(iot_plugin)
@@ -91,8 +90,13 @@ class IoTAgent(BaseAgent):
         Your primary role is to analyze IoT sensor data and answer user queries based on this data.
 
         Instructions:
-        1.  When a user asks a question that might require current campus conditions or sensor data, first try to use the 'get_latest_telemetry' function from the 'IoTPlugin' to fetch recent IoT sensor readings.
-        2.  The IoT data will be provided to you as a JSON string. Analyze this IoT data in conjunction with the user's query to provide a concise and relevant answer.
+        1.  When a user asks a question that might require current campus conditions or sensor data, use the functions from the 'IoTPlugin':
+            - 'aggregate_telemetry' for averages, minimums, maximums or counts of a metric (e.g. "average temperature in building B this morning"), filtered by device, room, building and time window.
+            - 'query_telemetry' for recent readings of a specific device, room or building, optionally limited to one metric and a time window.
+            - 'get_anomalies' for unusual or abnormal readings (e.g. "anything odd in the last hour?"); lower the threshold (default 3 standard deviations, minimum {ANOMALY_STORE_THRESHOLD}) to be more sensitive.
+            - 'get_latest_telemetry' only for a general snapshot of the most recent readings.
+            Time windows are ISO 8601 UTC timestamps; work them out from the current UTC time above.
+        2.  Readings are returned as a table: a '|'-separated header line of field names, then one line per reading (aggregates come back as compact JSON). Analyze this IoT data in conjunction with the user's query to provide a concise and relevant answer.
         3.  If the 'get_latest_telemetry' function returns an error, indicates data retrieval issues, or if the IoTDataSkill is unavailable (e.g., due to missing configuration or initialization failure), inform the user that current IoT data cannot be accessed. Then, try to answer based on general knowledge if possible, or state that the query cannot be fulfilled without live data.
         4.  If the user's query is general and does not explicitly require IoT data (e.g., "hello", "what can you do?"), respond appropriately without attempting to fetch data if it's not necessary.
         5.  Be helpful and clear in your responses. If data is unavailable, clearly state this limitation.
@@ -1,16 +1,210 @@
+import asyncio
 import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
 from semantic_kernel.functions import kernel_function
 from azure.cosmos import CosmosClient
 
+from agents.iot.anomaly_detector import ANOMALY_STORE_THRESHOLD, AnomalyDetector
+from agents.result_format import format_table
+from agents.iot.telemetry_cache import TelemetryCache, parse_timestamp
+
+# Telemetry document schema. Metrics (temperature, humidity, ...) are top-level properties.
+IOT_DEVICE_FIELD = os.getenv("IOT_DEVICE_FIELD", "deviceId")
+IOT_ROOM_FIELD = os.getenv("IOT_ROOM_FIELD", "room")
+IOT_BUILDING_FIELD = os.getenv("IOT_BUILDING_FIELD", "building")
+IOT_TIMESTAMP_FIELD = os.getenv("IOT_TIMESTAMP_FIELD", "timestamp")
+# Property the telemetry container is partitioned on; queries filtered on it hit a single partition
+IOT_PARTITION_KEY_FIELD = os.getenv("IOT_PARTITION_KEY_FIELD", IOT_DEVICE_FIELD)
+
+MAX_QUERY_ROWS = 100
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _field(name: str) -> str:
+    # Property names can't be query parameters, so only allow plain identifiers
+    if not _FIELD_NAME.match(name):
+        raise ValueError(f"Invalid field name: {name!r}")
+    return f"c.{name}"
 
 
 class IoTDataSkill:
-    def __init__(self, cosmos_connection_string, db_name, container_name):
+    def __init__(self, cosmos_connection_string, db_name, container_name, use_cache: bool = False):
         self.client = CosmosClient.from_connection_string(cosmos_connection_string)
         self.container = self.client.get_database_client(db_name).get_container_client(container_name)
+        self.telemetry_cache: Optional[TelemetryCache] = None
+        self.anomaly_detector: Optional[AnomalyDetector] = None
+        if use_cache:
+            # Answer reads from an in-memory window fed by the change feed instead of querying Cosmos
+            self.telemetry_cache = TelemetryCache(
+                self.container,
+                device_field=IOT_DEVICE_FIELD,
+                label_fields=[IOT_ROOM_FIELD, IOT_BUILDING_FIELD],
+                timestamp_field=IOT_TIMESTAMP_FIELD,
+            )
+            # Registered before start() so seeded readings warm the baselines too
+            self.anomaly_detector = AnomalyDetector()
+            self.telemetry_cache.add_listener(self.anomaly_detector.update)
+            self.telemetry_cache.start()
+
+    def _cache_ready(self) -> bool:
+        return self.telemetry_cache is not None and self.telemetry_cache.ready.is_set()
+
+    def _cache_filters(self, device_id: Optional[str], room: Optional[str], building: Optional[str]) -> Dict[str, Optional[str]]:
+        return {IOT_DEVICE_FIELD: device_id, IOT_ROOM_FIELD: room, IOT_BUILDING_FIELD: building}
 
     @kernel_function(name="get_latest_telemetry", description="Fetch latest IoT sensor readings")
     async def get_latest_telemetry(self):
+        if self._cache_ready():
+            results = self.telemetry_cache.latest({}, limit=10)
+            if results:
+                return format_table(results)
         query = "SELECT * FROM c ORDER BY c.timestamp DESC OFFSET 0 LIMIT 10"
         results = list(self.container.query_items(query, enable_cross_partition_query=True))
-        return json.dumps(results, indent=2)
+        return format_table(results)
+
+    def _build_filters(self, device_id: Optional[str], room: Optional[str], building: Optional[str],
+                       start_time: Optional[str], end_time: Optional[str]) -> Tuple[str, List[Dict[str, Any]]]:
+        clauses = []
+        params: List[Dict[str, Any]] = []
+        for field, name, value in (
+            (IOT_DEVICE_FIELD, "@device", device_id),
+            (IOT_ROOM_FIELD, "@room", room),
+            (IOT_BUILDING_FIELD, "@building", building),
+        ):
+            if value:
+                clauses.append(f"{_field(field)} = {name}")
+                params.append({"name": name, "value": value})
+        if start_time:
+            clauses.append(f"{_field(IOT_TIMESTAMP_FIELD)} >= @start")
+            params.append({"name": "@start", "value": start_time})
+        if end_time:
+            clauses.append(f"{_field(IOT_TIMESTAMP_FIELD)} < @end")
+            params.append({"name": "@end", "value": end_time})
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _partition_for(self, device_id: Optional[str], room: Optional[str], building: Optional[str]) -> Optional[str]:
+        filters = {IOT_DEVICE_FIELD: device_id, IOT_ROOM_FIELD: room, IOT_BUILDING_FIELD: building}
+        return filters.get(IOT_PARTITION_KEY_FIELD) or None
+
+    async def _query(self, query: str, params: List[Dict[str, Any]], partition_key: Optional[str]) -> List[Any]:
+        def run() -> List[Any]:
+            if partition_key is not None:
+                items = self.container.query_items(query, parameters=params, partition_key=partition_key)
+            else:
+                items = self.container.query_items(query, parameters=params, enable_cross_partition_query=True)
+            return list(items)
+        # The Cosmos client is synchronous; keep it off the event loop
+        return await asyncio.to_thread(run)
+
+    @kernel_function(
+        name="query_telemetry",
+        description=(
+            "Fetch recent readings filtered by device, room, building and/or an ISO UTC time window. "
+            "If metric is given (e.g. 'temperature'), only that value is returned per reading. Newest first."
+        )
+    )
+    async def query_telemetry(self, device_id: Optional[str] = None, room: Optional[str] = None,
+                              building: Optional[str] = None, metric: Optional[str] = None,
+                              start_time: Optional[str] = None, end_time: Optional[str] = None,
+                              limit: int = 20) -> str:
+        start_ts, end_ts = parse_timestamp(start_time), parse_timestamp(end_time)
+        if self._cache_ready() and (start_time is None or self.telemetry_cache.covers(start_ts)):
+            results = self.telemetry_cache.latest(
+                self._cache_filters(device_id, room, building), limit=max(1, min(int(limit), MAX_QUERY_ROWS)),
+                metric=metric, start=start_ts, end=end_ts
+            )
+            if results:
+                return format_table(results)
+
+        try:
+            where, params = self._build_filters(device_id, room, building, start_time, end_time)
+            columns = [IOT_DEVICE_FIELD, IOT_ROOM_FIELD, IOT_TIMESTAMP_FIELD]
+            projection = ", ".join(_field(c) for c in columns)
+            if metric:
+                projection += f", {_field(metric)}"
+            else:
+                projection = "*"
+            params.append({"name": "@limit", "value": max(1, min(int(limit), MAX_QUERY_ROWS))})
+            query = f"SELECT TOP @limit {projection} FROM c{where} ORDER BY {_field(IOT_TIMESTAMP_FIELD)} DESC"
+            results = await self._query(query, params, self._partition_for(device_id, room, building))
+        except ValueError as e:
+            return f"Error: {e}"
+        except Exception as e:
+            print(f"[IoTDataSkill] Telemetry query failed: {e}")
+            return "Error: Could not query IoT telemetry."
+        if not results:
+            return "No telemetry found for those filters."
+        return format_table(results)
+
+    @kernel_function(
+        name="aggregate_telemetry",
+        description=(
+            "Compute AVG, MIN, MAX and COUNT of a metric (e.g. 'temperature') server-side, optionally filtered "
+            "by device, room, building and an ISO UTC time window. Use for averages, ranges and trends."
+        )
+    )
+    async def aggregate_telemetry(self, metric: str, device_id: Optional[str] = None, room: Optional[str] = None,
+                                  building: Optional[str] = None, start_time: Optional[str] = None,
+                                  end_time: Optional[str] = None) -> str:
+        start_ts, end_ts = parse_timestamp(start_time), parse_timestamp(end_time)
+        if self._cache_ready() and self.telemetry_cache.covers(start_ts):
+            stats = self.telemetry_cache.aggregate(
+                metric, self._cache_filters(device_id, room, building), start=start_ts, end=end_ts
+            )
+            if stats["count"]:
+                return json.dumps(stats, separators=(",", ":"))
+
+        try:
+            metric_field = _field(metric)
+            where, params = self._build_filters(device_id, room, building, start_time, end_time)
+            # Only readings that actually carry the metric count towards the aggregates
+            where += (" AND " if where else " WHERE ") + f"IS_NUMBER({metric_field})"
+            partition_key = self._partition_for(device_id, room, building)
+            # Single-aggregate VALUE queries are supported cross-partition by every SDK version; run them together
+            aggregates = ("AVG", "MIN", "MAX", "COUNT")
+            results = await asyncio.gather(*(
+                self._query(f"SELECT VALUE {fn}({metric_field}) FROM c{where}", params, partition_key)
+                for fn in aggregates
+            ))
+        except ValueError as e:
+            return f"Error: {e}"
+        except Exception as e:
+            print(f"[IoTDataSkill] Telemetry aggregation failed: {e}")
+            return "Error: Could not aggregate IoT telemetry."
+
+        stats = {fn.lower(): (rows[0] if rows else None) for fn, rows in zip(aggregates, results)}
+        if not stats["count"]:
+            return f"No '{metric}' readings found for those filters."
+        if isinstance(stats["avg"], float):
+            stats["avg"] = round(stats["avg"], 2)
+        return json.dumps({"metric": metric, **stats}, separators=(",", ":"))
+
+    @kernel_function(
+        name="get_anomalies",
+        description=(
+            "List sensor readings from the last window_minutes that deviate from that sensor's usual "
+            "(time-of-day) baseline by at least threshold standard deviations, strongest first. "
+            f"Optionally filter by device_id or metric. The lowest usable threshold is {ANOMALY_STORE_THRESHOLD}."
+        )
+    )
+    async def get_anomalies(self, window_minutes: int = 60, threshold: float = 3.0,
+                            device_id: Optional[str] = None, metric: Optional[str] = None) -> str:
+        if self.anomaly_detector is None:
+            return "Error: Anomaly detection needs the telemetry cache (set IOT_TELEMETRY_CACHE=true)."
+        # Weaker deviations were never recorded, so a lower threshold cannot find more
+        note = None
+        if float(threshold) < ANOMALY_STORE_THRESHOLD:
+            note = (f"Threshold raised from {threshold} to {ANOMALY_STORE_THRESHOLD}, "
+                    f"the lowest deviation that is recorded.")
+            threshold = ANOMALY_STORE_THRESHOLD
+        anomalies = self.anomaly_detector.get_anomalies(
+            window_seconds=max(1, int(window_minutes)) * 60, threshold=float(threshold),
+            device_id=device_id, metric=metric
+        )
+        if not anomalies:
+            message = f"No anomalies above {threshold} standard deviations in the last {window_minutes} minutes."
+            return f"{note} {message}" if note else message
+        return format_table(anomalies, title=note)
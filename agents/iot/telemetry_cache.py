@@ -0,0 +1,269 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+IOT_TELEMETRY_WINDOW = int(os.getenv("IOT_TELEMETRY_WINDOW", "1024"))
+IOT_CHANGE_FEED_POLL_SECONDS = float(os.getenv("IOT_CHANGE_FEED_POLL_SECONDS", "2"))
+
+# Document properties that are never treated as metrics
+_NON_METRIC_FIELDS = {"id", "_rid", "_self", "_etag", "_attachments", "_ts", "_lsn", "ttl"}
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Convert an ISO string or epoch number into epoch seconds (UTC)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_timestamp(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class DeviceRingBuffer:
+    """Fixed-size, column-wise ring buffer of one device's readings.
+
+    Timestamps and each metric live in their own float64 array; a metric missing from a
+    reading is stored as NaN, so aggregations are plain vectorized NumPy calls.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # Next slot to write
+        self.timestamps = np.full(capacity, np.nan)
+        self.metrics: Dict[str, np.ndarray] = {}
+        self.labels: Dict[str, Any] = {}  # Latest room/building etc.
+
+    def append(self, timestamp: float, values: Dict[str, float]):
+        i = self.head
+        self.timestamps[i] = timestamp
+        for name, column in self.metrics.items():
+            column[i] = values.get(name, np.nan)
+        for name, value in values.items():
+            if name not in self.metrics:
+                column = np.full(self.capacity, np.nan)
+                column[i] = value
+                self.metrics[name] = column
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def valid_slots(self) -> np.ndarray:
+        """Indices of stored readings, oldest first."""
+        if self.size < self.capacity:
+            return np.arange(self.size)
+        return (np.arange(self.capacity) + self.head) % self.capacity
+
+    def oldest_timestamp(self) -> float:
+        if self.size == 0:
+            return math.inf
+        return float(np.nanmin(self.timestamps[self.valid_slots()]))
+
+    def window_mask(self, start: Optional[float], end: Optional[float]) -> np.ndarray:
+        mask = np.zeros(self.capacity, dtype=bool)
+        mask[self.valid_slots()] = True
+        if start is not None:
+            mask &= self.timestamps >= start
+        if end is not None:
+            mask &= self.timestamps < end
+        return mask
+
+    def reading(self, slot: int) -> Dict[str, Any]:
+        values = {name: float(column[slot]) for name, column in self.metrics.items() if not np.isnan(column[slot])}
+        return {"timestamp": format_timestamp(self.timestamps[slot]), **values}
+
+
+class TelemetryCache:
+    """Rolling in-memory telemetry window fed by the Cosmos DB change feed.
+
+    A daemon thread seeds the cache with the latest readings, then tails the telemetry
+    container's change feed into per-device ring buffers. Reads take a lock and run
+    NumPy over at most IOT_TELEMETRY_WINDOW readings per device, so they never touch Cosmos.
+    """
+
+    def __init__(self, container, device_field: str, label_fields: List[str], timestamp_field: str,
+                 capacity: int = IOT_TELEMETRY_WINDOW, poll_interval: float = IOT_CHANGE_FEED_POLL_SECONDS,
+                 seed_count: int = 500):
+        self.container = container
+        self.device_field = device_field
+        self.label_fields = label_fields
+        self.timestamp_field = timestamp_field
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.seed_count = seed_count
+        self.devices: Dict[str, DeviceRingBuffer] = {}
+        # Numeric identifiers (e.g. room 101) must not be mistaken for metrics
+        self._identity_fields = {device_field, timestamp_field, *label_fields}
+        self.ingest_started_at: Optional[float] = None
+        self.ready = threading.Event()
+        self._listeners: List[Callable[[str, float, Dict[str, float]], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="iot-telemetry-cache", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def add_listener(self, listener: Callable[[str, float, Dict[str, float]], None]):
+        """Call listener(device_id, timestamp, metrics) for every reading ingested."""
+        self._listeners.append(listener)
+
+    def ingest(self, doc: Dict[str, Any]):
+        """Add one telemetry document to its device's ring buffer."""
+        device_id = doc.get(self.device_field)
+        timestamp = parse_timestamp(doc.get(self.timestamp_field)) or parse_timestamp(doc.get("_ts"))
+        if device_id is None or timestamp is None:
+            return
+        values = {
+            key: float(value) for key, value in doc.items()
+            if key not in _NON_METRIC_FIELDS and key not in self._identity_fields
+            and isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+        with self._lock:
+            buffer = self.devices.get(device_id)
+            if buffer is None:
+                buffer = self.devices[device_id] = DeviceRingBuffer(self.capacity)
+            buffer.append(timestamp, values)
+            for field in self.label_fields:
+                if doc.get(field) is not None:
+                    buffer.labels[field] = doc[field]
+        for listener in self._listeners:
+            try:
+                listener(str(device_id), timestamp, values)
+            except Exception as e:
+                print(f"[TelemetryCache] Listener failed: {e}")
+
+    def _run(self):
+        seeded_ids = set()
+        try:
+            seeded_ids = self._seed()
+        except Exception as e:
+            print(f"[TelemetryCache] Could not seed telemetry cache: {e}")
+        continuation = None
+        while not self._stop.is_set():
+            try:
+                # Headers of this feed's own page requests; the client's last_response_headers is shared
+                # with every other call on the container and may hold an item's etag instead
+                responses: List[Any] = []
+                # The first read starts where the seed query began, so readings written while it ran
+                # are not missed (covers() counts them as cached)
+                start = {} if continuation is not None else {
+                    "start_time": datetime.fromtimestamp(self.ingest_started_at, timezone.utc)
+                }
+                feed = self.container.query_items_change_feed(
+                    is_start_from_beginning=False, continuation=continuation,
+                    response_hook=lambda headers, _: responses.append(headers), **start
+                )
+                for doc in feed:
+                    # The seed may already hold readings the first read returns again
+                    if doc.get("id") not in seeded_ids:
+                        self.ingest(doc)
+                if responses:
+                    continuation = responses[-1].get("etag", continuation)
+                    seeded_ids = set()
+                self.ready.set()
+            except Exception as e:
+                print(f"[TelemetryCache] Change feed read failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _seed(self) -> set:
+        """Load the newest readings. Returns their ids."""
+        self.ingest_started_at = time.time()
+        query = f"SELECT TOP @n * FROM c ORDER BY c.{self.timestamp_field} DESC"
+        docs = list(self.container.query_items(
+            query, parameters=[{"name": "@n", "value": self.seed_count}], enable_cross_partition_query=True
+        ))
+        for doc in reversed(docs):
+            self.ingest(doc)
+        print(f"[TelemetryCache] Seeded with {len(docs)} readings from {len(self.devices)} devices.")
+        return {doc.get("id") for doc in docs}
+
+    def covers(self, start: Optional[float]) -> bool:
+        """True if every reading since `start` is guaranteed to be in the cache."""
+        if not self.ready.is_set() or start is None or self.ingest_started_at is None:
+            return False
+        with self._lock:
+            # Full buffers have dropped their oldest readings
+            evicted_until = max(
+                (b.oldest_timestamp() for b in self.devices.values() if b.size == b.capacity), default=-math.inf
+            )
+        return start >= max(self.ingest_started_at, evicted_until)
+
+    def _matching(self, filters: Dict[str, Optional[str]]) -> List[tuple]:
+        # Caller must hold the lock
+        matches = []
+        for device_id, buffer in self.devices.items():
+            if filters.get(self.device_field) and str(device_id) != str(filters[self.device_field]):
+                continue
+            # Compare as strings: rooms are often stored as numbers but asked for as text
+            if any(value and str(buffer.labels.get(field)) != str(value)
+                   for field, value in filters.items() if field != self.device_field):
+                continue
+            matches.append((device_id, buffer))
+        return matches
+
+    def latest(self, filters: Dict[str, Optional[str]], limit: int = 10, metric: Optional[str] = None,
+               start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Newest readings across matching devices, newest first."""
+        candidates = []
+        with self._lock:
+            for device_id, buffer in self._matching(filters):
+                mask = buffer.window_mask(start, end)
+                if metric is not None:
+                    column = buffer.metrics.get(metric)
+                    if column is None:
+                        continue
+                    mask &= ~np.isnan(column)
+                slots = np.flatnonzero(mask)
+                newest = slots[np.argsort(buffer.timestamps[slots])[::-1][:limit]]
+                for slot in newest:
+                    candidates.append((buffer.timestamps[slot], device_id, buffer, slot))
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            results = []
+            for _, device_id, buffer, slot in candidates[:limit]:
+                reading = buffer.reading(slot)
+                if metric is not None:
+                    reading = {"timestamp": reading["timestamp"], metric: reading.get(metric)}
+                results.append({self.device_field: device_id, **buffer.labels, **reading})
+        return results
+
+    def aggregate(self, metric: str, filters: Dict[str, Optional[str]],
+                  start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, Any]:
+        """AVG/MIN/MAX/COUNT of a metric over matching devices and time window."""
+        chunks = []
+        with self._lock:
+            for _, buffer in self._matching(filters):
+                column = buffer.metrics.get(metric)
+                if column is None:
+                    continue
+                values = column[buffer.window_mask(start, end)]
+                chunks.append(values[~np.isnan(values)])
+        values = np.concatenate(chunks) if chunks else np.empty(0)
+        if values.size == 0:
+            return {"metric": metric, "avg": None, "min": None, "max": None, "count": 0}
+        return {
+            "metric": metric,
+            "avg": round(float(values.mean()), 2),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "count": int(values.size),
+        }
@@ -0,0 +1,48 @@
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from agents.token_count import count_tokens
+
+# Upper bound on the tokens a single tool result may add to the conversation
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "800"))
+
+# Cosmos DB bookkeeping properties; meaningless to the model
+COSMOS_SYSTEM_FIELDS = frozenset({"_rid", "_self", "_etag", "_attachments", "_ts", "_lsn"})
+
+
+def strip_system_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in doc.items() if key not in COSMOS_SYSTEM_FIELDS}
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return str(round(value, 4)).removesuffix(".0")
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def format_table(rows: Iterable[Dict[str, Any]], columns: Optional[Sequence[str]] = None,
+                 title: Optional[str] = None, max_tokens: int = TOOL_RESULT_TOKEN_BUDGET) -> str:
+    """Render records as a '|'-separated header line plus one line per record.
+
+    Keys are written once in the header instead of once per record, Cosmos system fields
+    are dropped, and rows stop once max_tokens is reached with a note of how many were cut.
+    """
+    records = [strip_system_fields(row) for row in rows]
+    if columns is None:
+        # Union of keys, in first-seen order
+        columns = list(dict.fromkeys(key for record in records for key in record))
+
+    lines: List[str] = [title] if title else []
+    lines.append("|".join(columns))
+    used = sum(count_tokens(line) + 1 for line in lines)
+    for i, record in enumerate(records):
+        line = "|".join(_cell(record.get(column)) for column in columns)
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens and i > 0:
+            lines.append(f"...{len(records) - i} more rows omitted; narrow the query to see them.")
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
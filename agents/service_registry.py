@@ -0,0 +1,68 @@
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncAzureOpenAI
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+
+DEFAULT_API_VERSION = "2024-12-01-preview"
+
+# Connection pool settings shared by every agent talking to the same Azure OpenAI deployment.
+# AZURE_OPENAI_MAX_CONNECTIONS also caps the number of concurrent requests per deployment.
+MAX_CONNECTIONS = int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AZURE_OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("AZURE_OPENAI_KEEPALIVE_EXPIRY_SECONDS", "60"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("AZURE_OPENAI_REQUEST_TIMEOUT_SECONDS", "60"))
+
+_services: Dict[Tuple[str, str, str, str], AzureChatCompletion] = {}
+_services_lock = threading.Lock()
+
+
+def get_chat_service(
+    endpoint: str,
+    api_key: str,
+    deployment_name: str,
+    api_version: Optional[str] = None,
+) -> AzureChatCompletion:
+    """Return the shared AzureChatCompletion for an endpoint/deployment/API version.
+
+    All agents using the same deployment get the same service object, backed by one
+    AsyncAzureOpenAI client and one pooled httpx connection pool.
+    """
+    api_version = api_version or DEFAULT_API_VERSION
+    key = (endpoint, deployment_name, api_version, api_key)
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+                ),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS),
+            )
+            async_client = AsyncAzureOpenAI(
+                azure_endpoint=endpoint,
+                api_key=api_key,
+                api_version=api_version,
+                http_client=http_client,
+            )
+            service = AzureChatCompletion(
+                service_id=f"{deployment_name}_chat_service",
+                api_key=api_key,
+                endpoint=endpoint,
+                deployment_name=deployment_name,
+                api_version=api_version,
+                async_client=async_client,
+            )
+            _services[key] = service
+            print(f"Created shared chat service for deployment '{deployment_name}' (max {MAX_CONNECTIONS} connections).")
+        return service
+
+
+def get_service_count() -> int:
+    """Number of distinct chat services (and connection pools) created so far."""
+    with _services_lock:
+        return len(_services)
@@ -0,0 +1,234 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+from agents.data_dir import data_path
+
+DEFAULT_SESSION_ID = "default"
+
+
+class SessionStore(ABC):
+    """Session-keyed conversation history.
+
+    Each session keeps at most `max_messages` messages (oldest dropped first) and
+    sessions idle for longer than `ttl_seconds` are evicted.
+    History entries are dicts of the form {"role": "...", "content": "...", "seq": n},
+    where seq increases monotonically within a session.
+    """
+
+    def __init__(self, max_messages: int = 20, ttl_seconds: float = 3600):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        """Return the stored messages for a session, oldest first."""
+        pass
+
+    @abstractmethod
+    def append(self, session_id: str, role: str, content: str) -> List[Dict[str, str]]:
+        """Append a single message to a session. Returns the messages that dropped out of the ring."""
+        pass
+
+    @abstractmethod
+    def clear(self, session_id: str):
+        """Remove all history for a session."""
+        pass
+
+    @abstractmethod
+    def evict_expired(self) -> int:
+        """Drop sessions idle for longer than the TTL. Returns the number evicted."""
+        pass
+
+    def append_turn(self, session_id: str, user_message: str, assistant_message: str) -> List[Dict[str, str]]:
+        """Record a completed user/assistant exchange. Returns the messages that dropped out of the ring."""
+        evicted = self.append(session_id, "user", user_message)
+        evicted += self.append(session_id, "assistant", assistant_message)
+        return evicted
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process LRU of sessions, each holding a bounded ring buffer of messages."""
+
+    def __init__(self, max_messages: int = 20, ttl_seconds: float = 3600, max_sessions: int = 1000):
+        super().__init__(max_messages, ttl_seconds)
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Deque[Dict[str, str]]]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._next_seq: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _touch(self, session_id: str, create: bool) -> Optional[Deque[Dict[str, str]]]:
+        # Caller must hold the lock
+        now = time.monotonic()
+        messages = self._sessions.get(session_id)
+        if messages is not None and now - self._last_access[session_id] > self.ttl_seconds:
+            self._drop(session_id)
+            messages = None
+        if messages is None:
+            if not create:
+                return None
+            messages = deque(maxlen=self.max_messages)
+            self._sessions[session_id] = messages
+            while len(self._sessions) > self.max_sessions:
+                oldest_id, _ = self._sessions.popitem(last=False)
+                self._last_access.pop(oldest_id, None)
+                self._next_seq.pop(oldest_id, None)
+        self._sessions.move_to_end(session_id)
+        self._last_access[session_id] = now
+        return messages
+
+    def _drop(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._last_access.pop(session_id, None)
+        self._next_seq.pop(session_id, None)
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        with self._lock:
+            messages = self._touch(session_id, create=False)
+            return list(messages) if messages else []
+
+    def append(self, session_id: str, role: str, content: str) -> List[Dict[str, str]]:
+        with self._lock:
+            messages = self._touch(session_id, create=True)
+            evicted = [messages[0]] if len(messages) == messages.maxlen else []
+            seq = self._next_seq.get(session_id, 0)
+            self._next_seq[session_id] = seq + 1
+            messages.append({"role": role, "content": content, "seq": seq})
+            return evicted
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+
+    def evict_expired(self) -> int:
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            expired = [sid for sid, last in self._last_access.items() if last < cutoff]
+            for session_id in expired:
+                self._drop(session_id)
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """File-backed session store shared by every worker process on the host.
+
+    Uses SQLite in WAL mode so concurrent gunicorn workers can read and write
+    the same history safely.
+    """
+
+    def __init__(self, db_path: str, max_messages: int = 20, ttl_seconds: float = 3600):
+        super().__init__(max_messages, ttl_seconds)
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_messages ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " session_id TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " content TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages (session_id, id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_access ON chat_sessions (last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        conn = self._connection()
+        with conn:
+            row = conn.execute("SELECT last_access FROM chat_sessions WHERE session_id=?", (session_id,)).fetchone()
+            if row is None:
+                return []
+            now = time.time()
+            if now - row[0] > self.ttl_seconds:
+                self._delete_session(conn, session_id)
+                return []
+            conn.execute("UPDATE chat_sessions SET last_access=? WHERE session_id=?", (now, session_id))
+            rows = conn.execute(
+                "SELECT id, role, content FROM chat_messages WHERE session_id=? ORDER BY id",
+                (session_id,)
+            ).fetchall()
+        # The autoincrement id doubles as the monotonic sequence number
+        return [{"role": role, "content": content, "seq": seq} for seq, role, content in rows]
+
+    def append(self, session_id: str, role: str, content: str) -> List[Dict[str, str]]:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO chat_sessions (session_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_access=excluded.last_access",
+                (session_id, time.time())
+            )
+            conn.execute(
+                "INSERT INTO chat_messages (session_id, role, content) VALUES (?, ?, ?)",
+                (session_id, role, content)
+            )
+            # Keep only the newest max_messages rows for this session
+            evicted = conn.execute(
+                "SELECT id, role, content FROM chat_messages WHERE session_id=? AND id NOT IN ("
+                " SELECT id FROM chat_messages WHERE session_id=? ORDER BY id DESC LIMIT ?) ORDER BY id",
+                (session_id, session_id, self.max_messages)
+            ).fetchall()
+            conn.executemany("DELETE FROM chat_messages WHERE id=?", [(seq,) for seq, _, _ in evicted])
+        return [{"role": role, "content": content, "seq": seq} for seq, role, content in evicted]
+
+    def clear(self, session_id: str):
+        conn = self._connection()
+        with conn:
+            self._delete_session(conn, session_id)
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "DELETE FROM chat_messages WHERE session_id IN ("
+                " SELECT session_id FROM chat_sessions WHERE last_access < ?)",
+                (cutoff,)
+            )
+            return conn.execute("DELETE FROM chat_sessions WHERE last_access < ?", (cutoff,)).rowcount
+
+    @staticmethod
+    def _delete_session(conn: sqlite3.Connection, session_id: str):
+        conn.execute("DELETE FROM chat_messages WHERE session_id=?", (session_id,))
+        conn.execute("DELETE FROM chat_sessions WHERE session_id=?", (session_id,))
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by environment variables.
+
+    CHAT_HISTORY_BACKEND: "memory" (default) or "sqlite"
+    CHAT_HISTORY_DB_PATH: SQLite file used by the sqlite backend
+    CHAT_HISTORY_MAX_MESSAGES: messages kept per session (default 20, i.e. 10 turns)
+    CHAT_SESSION_TTL_SECONDS: idle time before a session is evicted (default 3600)
+    CHAT_MAX_SESSIONS: sessions kept by the in-memory backend (default 1000)
+    """
+    backend = os.getenv("CHAT_HISTORY_BACKEND", "memory").lower()
+    max_messages = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "20"))
+    ttl_seconds = float(os.getenv("CHAT_SESSION_TTL_SECONDS", "3600"))
+
+    if backend == "sqlite":
+        db_path = os.getenv("CHAT_HISTORY_DB_PATH") or data_path("chat_history.db")
+        return SQLiteSessionStore(db_path, max_messages=max_messages, ttl_seconds=ttl_seconds)
+    if backend != "memory":
+        print(f"Warning: Unknown CHAT_HISTORY_BACKEND '{backend}', falling back to in-memory store.")
+    max_sessions = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+    return InMemorySessionStore(max_messages=max_messages, ttl_seconds=ttl_seconds, max_sessions=max_sessions)
@@ -1,11 +1,33 @@
 import os
 import azure.cognitiveservices.speech as speechsdk
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import queue
+import re
 import threading
 import time
 
+SPEECH_VOICE = os.getenv("SPEECH_VOICE", "en-US-JennyNeural")
+# Voices clients may ask for (comma-separated); each one gets its own long-lived synthesizer pool
+SPEECH_VOICES = list(dict.fromkeys(
+    [SPEECH_VOICE] + [v.strip() for v in os.getenv("SPEECH_VOICES", "").split(",") if v.strip()]
+))
+# Synthesizers kept open per voice; more concurrent replies than this borrow a temporary one
+SPEECH_SYNTHESIZER_POOL_SIZE = int(os.getenv("SPEECH_SYNTHESIZER_POOL_SIZE", "2"))
+
+# Streamed audio is raw PCM so clients can play each chunk as it arrives, without a decoder
+STREAM_AUDIO_FORMAT = "raw-24khz-16bit-mono-pcm"
+STREAM_CHUNK_BYTES = 4800  # 100 ms of 24 kHz 16-bit mono audio
+# Sentence boundary: end punctuation (plus closing quotes/brackets) followed by whitespace, or a line break
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])[\"')\]]*\s+|\n+")
+# Markdown the model may emit that shouldn't be read aloud
+_MARKDOWN_NOISE = re.compile(r"[*_#`>|]+")
+# Shorter fragments are merged with the next sentence so synthesis isn't started for "Sure."
+MIN_SENTENCE_CHARS = 20
+
+# Audio clients push for streaming recognition: 16 kHz, 16-bit, mono PCM
+RECOGNITION_SAMPLE_RATE = 16000
+
 # Global variables
-_speech_synthesizer: Optional[speechsdk.SpeechSynthesizer] = None
 _speech_recognizer: Optional[speechsdk.SpeechRecognizer] = None
 _is_speaking = False
 _stop_flag = False
@@ -20,6 +42,189 @@ def _get_speech_config():
     
     return speechsdk.SpeechConfig(subscription=speech_key, region=speech_region)
 
+class SynthesizerPool:
+    """
+    Long-lived speech synthesizers for one voice and output.
+    Each synthesizer's websocket is opened up front with Connection.open, so a reply
+    starts speaking without paying for config, synthesizer and connection setup.
+    """
+
+    def __init__(self, voice: str, size: int = SPEECH_SYNTHESIZER_POOL_SIZE, to_speaker: bool = True):
+        self.voice = voice
+        self.size = size
+        self.to_speaker = to_speaker
+        self._speech_config = _get_speech_config()
+        self._speech_config.speech_synthesis_voice_name = voice
+        if not to_speaker:
+            self._speech_config.set_speech_synthesis_output_format(
+                speechsdk.SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm
+            )
+        self._idle: "queue.Queue[speechsdk.SpeechSynthesizer]" = queue.Queue()
+        # Keep each synthesizer's Connection referenced, otherwise it is closed when collected
+        self._connections: Dict[int, speechsdk.Connection] = {}
+        for _ in range(size):
+            self._idle.put(self._create())
+
+    def _create(self) -> speechsdk.SpeechSynthesizer:
+        audio_config = speechsdk.audio.AudioOutputConfig(use_default_speaker=True) if self.to_speaker else None
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=self._speech_config, audio_config=audio_config)
+        connection = speechsdk.Connection.from_speech_synthesizer(synthesizer)
+        connection.open(True)
+        self._connections[id(synthesizer)] = connection
+        return synthesizer
+
+    def acquire(self) -> speechsdk.SpeechSynthesizer:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._create()
+
+    def release(self, synthesizer: speechsdk.SpeechSynthesizer):
+        if self._idle.qsize() < self.size:
+            self._idle.put(synthesizer)
+        else:
+            connection = self._connections.pop(id(synthesizer), None)
+            if connection is not None:
+                connection.close()
+
+
+_pools: Dict[Tuple[str, bool], SynthesizerPool] = {}
+_pools_lock = threading.Lock()
+# Synthesizers currently speaking, so stop_speech can cancel them
+_active_synthesizers: Set[speechsdk.SpeechSynthesizer] = set()
+_active_lock = threading.Lock()
+
+def get_synthesizer_pool(voice: str = SPEECH_VOICE, to_speaker: bool = True) -> SynthesizerPool:
+    """Return the shared synthesizer pool for a voice, creating (and pre-connecting) it on first use."""
+    if voice not in SPEECH_VOICES:
+        # Pools are never closed, so only configured voices may create one
+        raise ValueError(f"Voice '{voice}' is not enabled; set SPEECH_VOICES to allow it")
+    with _pools_lock:
+        pool = _pools.get((voice, to_speaker))
+        if pool is None:
+            pool = SynthesizerPool(voice, to_speaker=to_speaker)
+            _pools[(voice, to_speaker)] = pool
+        return pool
+
+def warm_up_speech(voice: str = SPEECH_VOICE) -> str:
+    """
+    Pre-create the synthesizer pools for a voice so the first reply doesn't pay for connection setup.
+    """
+    try:
+        get_synthesizer_pool(voice, to_speaker=False)
+        get_synthesizer_pool(voice)
+        print(f"Speech synthesizer pool ready for {voice}")
+        return "Speech synthesizers warmed up"
+    except Exception as e:
+        print(f"Could not warm up speech synthesizers: {e}")
+        return f"Error warming up speech synthesizers: {e}"
+
+class SentenceSplitter:
+    """
+    Accumulates streamed text and hands back complete sentences as soon as they end.
+    """
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            sentence = _MARKDOWN_NOISE.sub("", self._buffer[start:match.end()]).strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> str:
+        rest = _MARKDOWN_NOISE.sub("", self._buffer).strip()
+        self._buffer = ""
+        return rest
+
+class SentenceSpeechStream:
+    """
+    Speaks text that arrives in pieces (e.g. LLM tokens) one sentence at a time.
+    Finished sentences are synthesized in order on a worker thread while the rest of the
+    text is still being generated; audio is passed to on_audio(seq, pcm_chunk) as the
+    service produces it, and on_done() is called once everything has been sent.
+    If synthesis fails, on_error(message) is called and the rest of the text is not spoken;
+    on_done() still follows.
+    """
+
+    def __init__(self, on_audio: Callable[[int, bytes], None], on_done: Optional[Callable[[], None]] = None,
+                 voice: str = SPEECH_VOICE, on_error: Optional[Callable[[str], None]] = None):
+        self.voice = voice
+        self._on_audio = on_audio
+        self._on_done = on_done
+        self._on_error = on_error
+        self._splitter = SentenceSplitter()
+        self._sentences: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._cancelled = threading.Event()
+        self._current: Optional[speechsdk.SpeechSynthesizer] = None
+        self._seq = 0
+        self._thread = threading.Thread(target=self._run, name="sentence-speech", daemon=True)
+        self._thread.start()
+
+    def feed(self, text: str):
+        for sentence in self._splitter.feed(text):
+            self._sentences.put(sentence)
+
+    def close(self):
+        """No more text is coming: speak whatever is left, then finish."""
+        rest = self._splitter.flush()
+        if rest:
+            self._sentences.put(rest)
+        self._sentences.put(None)
+
+    def cancel(self):
+        self._cancelled.set()
+        self._sentences.put(None)
+        synthesizer = self._current
+        if synthesizer is not None:
+            try:
+                synthesizer.stop_speaking_async().get()
+            except Exception as e:
+                print(f"Error stopping streamed speech: {e}")
+
+    def _run(self):
+        pool = None
+        try:
+            pool = get_synthesizer_pool(self.voice, to_speaker=False)
+            while not self._cancelled.is_set():
+                sentence = self._sentences.get()
+                if sentence is None:
+                    break
+                self._speak(pool, sentence)
+        except Exception as e:
+            print(f"Error in streamed speech synthesis: {e}")
+            if self._on_error:
+                self._on_error(str(e))
+        finally:
+            if self._on_done:
+                self._on_done()
+
+    def _speak(self, pool: SynthesizerPool, sentence: str):
+        synthesizer = pool.acquire()
+        self._current = synthesizer
+        try:
+            # Returns once synthesis has started; the audio is read while it is still being produced
+            result = synthesizer.start_speaking_text_async(sentence).get()
+            stream = speechsdk.AudioDataStream(result)
+            buffer = bytes(STREAM_CHUNK_BYTES)
+            while not self._cancelled.is_set():
+                filled = stream.read_data(buffer)
+                if filled == 0:
+                    break
+                self._on_audio(self._seq, buffer[:filled])
+                self._seq += 1
+        finally:
+            self._current = None
+            pool.release(synthesizer)
+
 def recognize_from_microphone() -> str:
     """
     Recognize speech from microphone and return the recognized text.
@@ -56,15 +261,106 @@ def recognize_from_microphone() -> str:
     finally:
         _speech_recognizer = None
 
-def speak_text(text: str) -> str:
+def strip_wav_header(data: bytes) -> bytes:
+    """Drop a RIFF/WAVE header from the first audio chunk, so recorded .wav files can be streamed as-is."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        index = data.find(b"data", 12)
+        if index != -1:
+            return data[index + 8:]
+    return data
+
+class StreamingRecognizer:
+    """
+    Continuous recognition of audio pushed by a client (e.g. a browser over WebSocket).
+    A single recognizer and PushAudioInputStream serve the whole session; on_result(event)
+    receives 'interim' hypotheses while the user speaks, 'final' text for each utterance
+    and 'error' events, from the Speech SDK's threads.
+    """
+
+    def __init__(self, on_result: Callable[[dict], None], language: str = "en-US"):
+        speech_config = _get_speech_config()
+        speech_config.speech_recognition_language = language
+        stream_format = speechsdk.audio.AudioStreamFormat(
+            samples_per_second=RECOGNITION_SAMPLE_RATE, bits_per_sample=16, channels=1
+        )
+        self._stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+        self.recognizer = speechsdk.SpeechRecognizer(
+            speech_config=speech_config, audio_config=speechsdk.audio.AudioConfig(stream=self._stream)
+        )
+        self.stopped = threading.Event()
+        self._on_result = on_result
+
+        self.recognizer.recognizing.connect(self._recognizing)
+        self.recognizer.recognized.connect(self._recognized)
+        self.recognizer.canceled.connect(self._canceled)
+        self.recognizer.session_stopped.connect(lambda evt: self.stopped.set())
+        self.recognizer.start_continuous_recognition_async().get()
+
+    def _recognizing(self, evt):
+        if evt.result.text:
+            self._on_result({"type": "interim", "text": evt.result.text})
+
+    def _recognized(self, evt):
+        if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech and evt.result.text:
+            self._on_result({"type": "final", "text": evt.result.text.strip()})
+
+    def _canceled(self, evt):
+        if evt.cancellation_details.reason == speechsdk.CancellationReason.Error:
+            print(f"Streaming recognition canceled: {evt.cancellation_details.error_details}")
+            self._on_result({"type": "error", "error": evt.cancellation_details.error_details})
+        self.stopped.set()
+
+    def write(self, audio: bytes):
+        self._stream.write(audio)
+
+    def finish(self, timeout: float = 10.0):
+        """End of audio: wait for the last utterance to be recognized, then stop."""
+        self._stream.close()
+        self.stopped.wait(timeout)
+        self.recognizer.stop_continuous_recognition_async().get()
+
+    def cancel(self):
+        self.stopped.set()
+        try:
+            self._stream.close()
+            self.recognizer.stop_continuous_recognition_async().get()
+        except Exception as e:
+            print(f"Error cancelling streaming recognition: {e}")
+
+_streaming_sessions: Dict[str, StreamingRecognizer] = {}
+_streaming_lock = threading.Lock()
+
+def start_streaming_recognition(session_id: str, on_result: Callable[[dict], None],
+                                language: str = "en-US") -> StreamingRecognizer:
+    """
+    Start the streaming recognizer for a session, replacing any earlier one for that session.
+    """
+    recognizer = StreamingRecognizer(on_result, language=language)
+    with _streaming_lock:
+        previous = _streaming_sessions.get(session_id)
+        _streaming_sessions[session_id] = recognizer
+    if previous is not None:
+        previous.cancel()
+    return recognizer
+
+def end_streaming_recognition(session_id: str, recognizer: StreamingRecognizer):
+    with _streaming_lock:
+        if _streaming_sessions.get(session_id) is recognizer:
+            del _streaming_sessions[session_id]
+    if not recognizer.stopped.is_set():
+        recognizer.cancel()
+
+def speak_text(text: str, voice: str = SPEECH_VOICE) -> str:
     """
     Convert text to speech and play it.
     """
-    global _speech_synthesizer, _is_speaking, _stop_flag
+    global _is_speaking, _stop_flag
     
     if not text:
         return "No text provided"
     
+    synthesizer = None
+    pool = None
     try:
         print(f"Starting speech synthesis: {text[:50]}...")
         
@@ -72,20 +368,19 @@ def speak_text(text: str) -> str:
         _stop_flag = False
         _is_speaking = True
         
-        # Get speech configuration
-        speech_config = _get_speech_config()
-        speech_config.speech_synthesis_voice_name = "en-US-JennyNeural"
-        
-        # Create synthesizer
-        _speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config)
+        # Borrow an already-connected synthesizer for this voice
+        pool = get_synthesizer_pool(voice)
+        synthesizer = pool.acquire()
         
         # Check stop flag before starting
         if _stop_flag:
             print("❌ CANCELLED before synthesis")
             return "Speech cancelled before starting"
         
+        with _active_lock:
+            _active_synthesizers.add(synthesizer)
         # Synthesize speech
-        result = _speech_synthesizer.speak_text(text)
+        result = synthesizer.speak_text(text)
         
         # Check stop flag after synthesis
         if _stop_flag:
@@ -110,7 +405,11 @@ def speak_text(text: str) -> str:
         return f"Error in speech synthesis: {e}"
     finally:
         _is_speaking = False
-        _speech_synthesizer = None
+        if synthesizer is not None:
+            with _active_lock:
+                _active_synthesizers.discard(synthesizer)
+            # Back to the pool for the next reply instead of being torn down
+            pool.release(synthesizer)
 
 def speak_text_async(text: str, speech_started_callback=None, speech_ended_callback=None) -> str:
     """
@@ -143,7 +442,7 @@ def stop_speech() -> str:
     """
     IMMEDIATELY STOP THE VOICE.
     """
-    global _speech_synthesizer, _is_speaking, _stop_flag
+    global _is_speaking, _stop_flag
     
     try:
         print("🛑 KILLING SPEECH NOW!")
@@ -152,48 +451,36 @@ def stop_speech() -> str:
         _stop_flag = True
         _is_speaking = False
         
-        # DESTROY THE SYNTHESIZER AGGRESSIVELY
-        if _speech_synthesizer is not None:
+        # Cancel whatever is playing; the synthesizers stay connected and go back to their pool
+        with _active_lock:
+            speaking = list(_active_synthesizers)
+        for synthesizer in speaking:
             try:
-                # Try multiple ways to kill it
-                if hasattr(_speech_synthesizer, 'close'):
-                    _speech_synthesizer.close()
-                if hasattr(_speech_synthesizer, 'stop_speaking_async'):
-                    _speech_synthesizer.stop_speaking_async()
-                print("🔥 Synthesizer methods called")
-            except:
-                pass
-            finally:
-                _speech_synthesizer = None
-                print("🗑️ Synthesizer destroyed")
-        
-        # Create and immediately destroy a new synthesizer to interrupt audio streams
-        try:
-            speech_config = _get_speech_config()
-            temp_synth = speechsdk.SpeechSynthesizer(speech_config=speech_config)
-            temp_synth = None
-            print("💥 Temporary synthesizer cycle - audio stream interrupted")
-        except:
-            pass
+                synthesizer.stop_speaking_async().get()
+            except Exception as e:
+                print(f"Error stopping synthesizer: {e}")
         
         print("✅ VOICE KILLED!")
         return "VOICE STOPPED IMMEDIATELY"
         
     except Exception as e:
         print(f"💀 Error but voice should be dead: {e}")
-        # NUCLEAR OPTION - reset everything
-        _speech_synthesizer = None
         _is_speaking = False
         _stop_flag = True
         return f"EMERGENCY VOICE KILL: {e}"
 
-def stop_recognition() -> str:
+def stop_recognition(session_id: Optional[str] = None) -> str:
     """
-    Stop ongoing speech recognition.
+    Stop ongoing speech recognition (and the session's streaming recognizer, if given).
     """
     global _speech_recognizer
     
     try:
+        if session_id is not None:
+            with _streaming_lock:
+                streaming = _streaming_sessions.get(session_id)
+            if streaming is not None:
+                streaming.cancel()
         if _speech_recognizer is not None:
             _speech_recognizer = None
             print("Speech recognition stopped")
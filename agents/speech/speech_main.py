@@ -48,16 +48,12 @@ class SpeechAgent(BaseAgent):
                 "SPEECH_KEY, and SPEECH_REGION environment variables.\n"
             )
 
-        kernel = Kernel()
-        az_service = AzureChatCompletion(
-            service_id=f"{self.get_agent_name().lower()}_chat_service",
-            api_key=config["openai_key"],
+        return self.create_kernel_and_service(
             endpoint=config["openai_endpoint"],
+            api_key=config["openai_key"],
             deployment_name=config["deployment_name"],
             api_version=config["api_version"]
         )
-        kernel.add_service(az_service)
-        return kernel, az_service
 
     def initialize_skills(self, config: Dict[str, Optional[str]], kernel: Kernel) -> List[Any]:
         """Initialize and return the SpeechSkill."""
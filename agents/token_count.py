@@ -0,0 +1,18 @@
+from functools import lru_cache
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # tiktoken is optional - fall back to the ~4 characters per token rule of thumb
+    _ENCODING = None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Approximate the number of model tokens in a piece of text."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, len(text) // 4)
@@ -0,0 +1,143 @@
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Pattern, Sequence, Tuple
+
+from agents.base_agent import BaseAgent
+
+# High-confidence intents that can go straight to a sub-agent without a triage model call.
+# Each rule is (agent name, compiled pattern); a message is routed only if every matching
+# rule points at the same agent.
+DEFAULT_RULES: List[Tuple[str, str]] = [
+    # Only imperative or first-person check-ins: "check in on the heating" or "check-in status of ..." are not
+    ("Attendance", r"\b(check|sign)\s+(me|us)\s+in\b|^(please\s+)?(check|sign)[\s-]in\s+(to|at|for)\b"
+                   r"|\b(i|we)(\s+want|\s+need|\s+would\s+like|'d\s+like)\s+to\s+(check|sign)[\s-]in\b"
+                   r"|\bmark\s+me\s+(as\s+)?(present|attending)\b"),
+    ("Attendance", r"\bdid\s+i\s+(attend|check\s+in)\b|\bmy\s+attendance\b"),
+    ("Calendar", r"\bwhat('?s|\s+is)\s+(on\s+)?my\s+(schedule|calendar|agenda)\b"),
+    ("Calendar", r"\bmy\s+(schedule|calendar|agenda|meetings|events)\s+(for\s+)?(today|tomorrow|this\s+week|next\s+week)\b"),
+    ("Calendar", r"\b(schedule|book|set\s+up)\s+(a\s+|an\s+)?(meeting|event|call)\b|\bcancel\s+(my\s+|the\s+|this\s+|that\s+)?(meeting|event)s?\b"),
+    ("IoT", r"\b(temperature|humidity|occupancy|co2|air\s+quality)\b.*\b(room|lab|building|hall|floor)\b"),
+    ("IoT", r"\b(room|lab|building|hall)\b.*\b(temperature|humidity|occupancy|co2|warm|cold|hot)\b"),
+]
+
+# Words that place a message in an agent's domain. A rule match is only trusted when no other
+# agent's words appear too ("cancel the event where the room is too cold" is not just IoT).
+DEFAULT_CUES: List[Tuple[str, str]] = [
+    ("Attendance", r"\b(attend\w*|check(ed)?[\s-]?in\w*|sign(ed)?[\s-]?in|present|absent)\b"),
+    ("Calendar", r"\b(calendar|schedule|agenda|meetings?|appointments?|cancel\w*|reschedule\w*|book\w*)\b"),
+    ("IoT", r"\b(temperature|humidity|occupancy|co2|air\s+quality|sensors?|heating|cooling|hvac|thermostat)\b"),
+]
+
+# Words that suggest the message depends on earlier turns or combines several requests;
+# those are left to the triage model.
+AMBIGUITY_PATTERN = re.compile(r"\b(it|that|those|them|again|also|then|instead)\b|\?.*\?", re.IGNORECASE)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "can", "do", "for", "from", "how", "i", "in",
+    "is", "me", "my", "of", "on", "or", "such", "the", "to", "use", "what", "with", "you", "e", "g",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def bag_of_words_embedding(text: str) -> Dict[str, float]:
+    """Tiny local embedding: L2-normalized term counts. Good enough to compare short intents."""
+    counts = Counter(_tokenize(text))
+    norm = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    return {term: c / norm for term, c in counts.items()}
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class FastPathRouter:
+    """Routes obvious single-intent messages straight to a sub-agent.
+
+    Keyword/regex rules are tried first; a rule match is ignored when the message also
+    matches another agent's rule or domain cue words. Optionally, a local embedding classifier built
+    from each agent's description and function descriptions is consulted when no rule
+    matches. Anything ambiguous returns None so the caller falls back to the triage LLM.
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[Tuple[str, str]] = DEFAULT_RULES,
+        cues: Sequence[Tuple[str, str]] = DEFAULT_CUES,
+        agent_profiles: Optional[Dict[str, str]] = None,
+        embed: Optional[Callable[[str], Dict[str, float]]] = None,
+        min_similarity: float = 0.35,
+        min_margin: float = 0.1,
+        max_message_length: int = 200,
+    ):
+        self.rules: List[Tuple[str, Pattern]] = [(agent, re.compile(p, re.IGNORECASE)) for agent, p in rules]
+        self.cues: List[Tuple[str, Pattern]] = [(agent, re.compile(p, re.IGNORECASE)) for agent, p in cues]
+        self.embed = embed
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.max_message_length = max_message_length
+        self.prototypes: Dict[str, Dict[str, float]] = {}
+        if embed is not None and agent_profiles:
+            self.prototypes = {name: embed(profile) for name, profile in agent_profiles.items()}
+        self.stats: Dict[str, int] = {"total": 0, "rule_hits": 0, "embedding_hits": 0, "fallbacks": 0}
+
+    @classmethod
+    def from_agents(cls, agents: Dict[str, BaseAgent], use_embeddings: bool = False, **kwargs) -> "FastPathRouter":
+        """Build a router restricted to the given agents, keyed by agent name."""
+        rules = [(name, pattern) for name, pattern in kwargs.pop("rules", DEFAULT_RULES) if name in agents]
+        cues = [(name, pattern) for name, pattern in kwargs.pop("cues", DEFAULT_CUES) if name in agents]
+        profiles = None
+        if use_embeddings:
+            profiles = {}
+            for name, agent in agents.items():
+                functions = " ".join(f["description"] for f in agent.get_function_descriptions())
+                profiles[name] = f"{agent.get_agent_description()} {functions}"
+        return cls(rules=rules, cues=cues, agent_profiles=profiles, embed=bag_of_words_embedding if use_embeddings else None, **kwargs)
+
+    def route(self, message: str) -> Optional[str]:
+        """Return the agent name for a high-confidence intent, or None to fall back to the LLM."""
+        self.stats["total"] += 1
+        text = message.strip()
+        if not text or len(text) > self.max_message_length or AMBIGUITY_PATTERN.search(text):
+            self.stats["fallbacks"] += 1
+            return None
+
+        matched = {agent for agent, pattern in self.rules if pattern.search(text)}
+        if matched:
+            mentioned = matched | {agent for agent, pattern in self.cues if pattern.search(text)}
+            if len(mentioned) == 1:
+                self.stats["rule_hits"] += 1
+                return matched.pop()
+            # Several agents' intents or domains in one message - needs the triage model
+            self.stats["fallbacks"] += 1
+            return None
+
+        agent = self._classify(text)
+        if agent is not None:
+            self.stats["embedding_hits"] += 1
+            return agent
+        self.stats["fallbacks"] += 1
+        return None
+
+    def _classify(self, text: str) -> Optional[str]:
+        if not self.prototypes:
+            return None
+        vector = self.embed(text)
+        scores = sorted(((_cosine(vector, proto), name) for name, proto in self.prototypes.items()), reverse=True)
+        best_score, best_agent = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        if best_score >= self.min_similarity and best_score - runner_up >= self.min_margin:
+            return best_agent
+        return None
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return routing counters plus the fraction of messages that skipped the triage LLM."""
+        hits = self.stats["rule_hits"] + self.stats["embedding_hits"]
+        total = self.stats["total"]
+        return {**self.stats, "hit_rate": hits / total if total else 0.0}
@@ -1,22 +1,48 @@
 import os
-from typing import Dict, List, Type
+import asyncio
+import json
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Type
 from datetime import datetime, timezone
 from semantic_kernel import Kernel
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 from semantic_kernel.agents import ChatCompletionAgent
 
 from agents.base_agent import BaseAgent 
+from agents.history_manager import HistoryManager
+from agents.service_registry import get_chat_service
+from agents.triage_agent.fast_router import FastPathRouter
 
 # --- Azure OpenAI Setup for Triage Agent ---
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_API_ENDPOINT")
 AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME", "gpt-4o-mini")
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
+# Token budget for verbatim conversation history; older turns are folded into a rolling summary
+TRIAGE_HISTORY_TOKEN_BUDGET = int(os.getenv("TRIAGE_HISTORY_TOKEN_BUDGET", "3000"))
+# Per-agent timeout (seconds) applied to each branch of a parallel delegation
+DELEGATION_TIMEOUT_SECONDS = float(os.getenv("DELEGATION_TIMEOUT_SECONDS", "60"))
+# Route obvious single-intent messages straight to a sub-agent, skipping the triage model call
+TRIAGE_FAST_PATH = os.getenv("TRIAGE_FAST_PATH", "true").lower() == "true"
+TRIAGE_FAST_PATH_EMBEDDINGS = os.getenv("TRIAGE_FAST_PATH_EMBEDDINGS", "false").lower() == "true"
+# Recent messages passed along with a fast-path delegation, so sub-agents can resolve references
+TRIAGE_FAST_PATH_CONTEXT_MESSAGES = int(os.getenv("TRIAGE_FAST_PATH_CONTEXT_MESSAGES", "4"))
+FAST_PATH_CONTEXT_CHARS = 500
+# Seconds to wait before retrying a sub-agent whose initialization failed
+AGENT_INIT_RETRY_SECONDS = float(os.getenv("AGENT_INIT_RETRY_SECONDS", "60"))
+
+# Per-request listener for delegation events. Callers that want live progress (e.g. the
+# streaming chat endpoint) set this before invoking the triage agent; tasks spawned while
+# handling the request inherit it, so concurrent requests never see each other's events.
+delegation_event_listener: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar(
+    "delegation_event_listener", default=None
+)
 
 class TriageAgent:
     def __init__(self, available_agents: List[Type[BaseAgent]], show_thoughts: bool = True):
-        """Initialize with a list of agent classes that inherit from BaseAgent."""
+        """Initialize with a list of agent classes that inherit from BaseAgent.
+        Sub-agents are only registered here; call warm_up() to build them ahead of the first request."""
         self.show_thoughts = show_thoughts
         print("Initializing TriageAgentPlugin and Triage Agent...")
         self.agents: Dict[str, Dict] = {}  # Store agent instances and their metadata
@@ -29,49 +55,48 @@ class TriageAgent:
 
         # --- Semantic Kernel Setup for Triage Agent ---
         triage_kernel = Kernel()
-        triage_service = AzureChatCompletion(
-            service_id="triage_chat_service",
-            api_key=AZURE_OPENAI_API_KEY,
+        triage_service = get_chat_service(
             endpoint=AZURE_OPENAI_ENDPOINT,
+            api_key=AZURE_OPENAI_API_KEY,
             deployment_name=AZURE_OPENAI_DEPLOYMENT_NAME,
             api_version=AZURE_OPENAI_API_VERSION,
         )
         triage_kernel.add_service(triage_service)
+        self.history_manager = HistoryManager(triage_service, max_history_tokens=TRIAGE_HISTORY_TOKEN_BUDGET)
         triage_kernel.add_plugin(plugin=self, plugin_name="SubAgentControls")
         print("SubAgentControls plugin added to Triage Kernel.")
 
-        # Initialize sub-agents
+        # Register sub-agents from their metadata only. Kernels, services and skills
+        # (Cosmos clients, etc.) are built on first delegation or by warm_up().
+        # Running initializations, shared by every caller that needs the agent meanwhile
+        self._init_tasks: Dict[str, asyncio.Task] = {}
         for agent_class in available_agents:
             try:
                 agent = agent_class()
                 agent_name = agent.get_agent_name()
-                print(f"\nInitializing {agent_name} Agent...")
-                
-                # Get configuration and initialize kernel/service
-                config = agent.get_configuration()
-                kernel, service = agent.initialize_kernel_and_service(config)
-                
-                # Initialize skills
-                skills = agent.initialize_skills(config, kernel)
-                
-                # Get agent instance
-                agent_instance = agent.get_agent_instance(kernel, service, skills)
-                
-                # Store everything we need about this agent
                 self.agents[agent_name] = {
-                    "instance": agent_instance,
+                    "instance": None,
                     "base": agent,
-                    "kernel": kernel,
-                    "service": service,
-                    "skills": skills
+                    "kernel": None,
+                    "service": None,
+                    "skills": None,
+                    "status": "registered",
+                    "error": None,
+                    "failed_at": None
                 }
-                print(f"{agent_name} Agent initialized successfully.")
-                
+                print(f"Registered {agent_name} Agent.")
             except Exception as e:
-                print(f"Failed to initialize {agent_class.__name__}: {e}")
+                print(f"Failed to register {agent_class.__name__}: {e}")
                 # Continue with other agents if one fails
                 continue
         
+        self.fast_router = None
+        if TRIAGE_FAST_PATH:
+            self.fast_router = FastPathRouter.from_agents(
+                {name: data["base"] for name, data in self.agents.items()},
+                use_embeddings=TRIAGE_FAST_PATH_EMBEDDINGS
+            )
+
         # --- Generate Triage Agent Instructions dynamically based on available agents ---
         TRIAGE_AGENT_INSTRUCTIONS = f"""
         You are a sophisticated Triage Agent. Your primary role is to understand complex user requests and orchestrate responses by intelligently delegating tasks to specialized agents.
@@ -97,6 +122,7 @@ class TriageAgent:
 
         2.  **Planning and Execution:**
             *   **Delegation:** Use the 'delegate_to_agent' function from the 'SubAgentControls' plugin to pass the task to the chosen specialized agent. You MUST specify the 'agent_name' (e.g., "Calendar", "IoT", "Speech", "Attendance") and the 'query' (the specific task or question for that agent).
+            *   **Independent Sub-tasks (Parallel):** If a query needs several agents and no step depends on another's output (e.g., "what's on my calendar and is room 101 warm"), use the 'delegate_parallel' function once with a list of tasks, each with an 'agent_name' and a 'query'. The agents run concurrently and you receive their results labelled by agent.
             *   **Complex Queries (Multi-step):** If a query requires information or actions from multiple agents, or a sequence of steps:
                 *   Formulate a clear, step-by-step plan.
                 *   Execute the plan by calling the 'delegate_to_agent' function for each step, targeting the appropriate agent with the relevant part of the query.
@@ -110,7 +136,7 @@ class TriageAgent:
             *   Do not just return raw data from sub-agents unless it's the direct answer. Explain the outcome of the actions taken.
             *   If any part of the request could not be fulfilled, clearly state what was done and what couldn't be done, and why.
 
-        Strictly use the 'delegate_to_agent' function within the 'SubAgentControls' plugin for all interactions with specialized agents.
+        Strictly use the 'delegate_to_agent' or 'delegate_parallel' functions within the 'SubAgentControls' plugin for all interactions with specialized agents.
         """
 
         # Instantiate and store the Triage Agent
@@ -124,6 +150,75 @@ class TriageAgent:
         print("Triage Agent instantiated and ready.")
 
 
+    def _build_agent(self, agent_name: str):
+        """Build the kernel, service, skills and agent instance for a registered agent (blocking)."""
+        agent_data = self.agents[agent_name]
+        agent = agent_data["base"]
+        print(f"\nInitializing {agent_name} Agent...")
+
+        # Get configuration and initialize kernel/service
+        config = agent.get_configuration()
+        kernel, service = agent.initialize_kernel_and_service(config)
+
+        # Initialize skills
+        skills = agent.initialize_skills(config, kernel)
+
+        # Get agent instance
+        agent_instance = agent.get_agent_instance(kernel, service, skills)
+
+        agent_data.update({
+            "instance": agent_instance,
+            "kernel": kernel,
+            "service": service,
+            "skills": skills
+        })
+        print(f"{agent_name} Agent initialized successfully.")
+
+    async def _ensure_agent_ready(self, agent_name: str) -> bool:
+        """Initialize an agent on first use. Concurrent callers share a single initialization."""
+        agent_data = self.agents[agent_name]
+        if agent_data["status"] == "ready":
+            return True
+
+        task = self._init_tasks.get(agent_name)
+        if task is None:
+            if agent_data["status"] == "failed" and time.monotonic() - agent_data["failed_at"] < AGENT_INIT_RETRY_SECONDS:
+                return False
+            agent_data["status"] = "initializing"
+            task = asyncio.get_running_loop().create_task(self._initialize_agent(agent_name))
+            self._init_tasks[agent_name] = task
+            task.add_done_callback(lambda _: self._init_tasks.pop(agent_name, None))
+        # A caller that is cancelled (timeout, client disconnect) stops waiting, but the build
+        # carries on and still records its outcome, so it is never started twice
+        return await asyncio.shield(task)
+
+    async def _initialize_agent(self, agent_name: str) -> bool:
+        agent_data = self.agents[agent_name]
+        try:
+            # Initialization does blocking I/O (Cosmos clients, etc.), keep it off the event loop
+            await asyncio.to_thread(self._build_agent, agent_name)
+            agent_data["status"] = "ready"
+            agent_data["error"] = None
+            return True
+        except Exception as e:
+            print(f"Failed to initialize {agent_name} Agent: {e}")
+            agent_data["status"] = "failed"
+            agent_data["error"] = str(e)
+            agent_data["failed_at"] = time.monotonic()
+            return False
+
+    async def warm_up(self, agent_names: Optional[List[str]] = None):
+        """Initialize the given (default: all) agents concurrently, e.g. in the background after startup."""
+        names = [name for name in (agent_names or list(self.agents)) if name in self.agents]
+        await asyncio.gather(*(self._ensure_agent_ready(name) for name in names))
+
+    def get_agent_status(self) -> Dict[str, Dict[str, Optional[str]]]:
+        """Report per-agent readiness: registered, initializing, ready or failed."""
+        return {
+            name: {"status": data["status"], "error": data["error"]}
+            for name, data in self.agents.items()
+        }
+
     def get_prompt_contributions(self) -> str:
         """Get the prompt contributions from all initialized agents."""
         contributions = []
@@ -136,6 +231,50 @@ class TriageAgent:
                 continue
         return "\n\n".join(contributions)
 
+    async def try_fast_path(self, message: str, history: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+        """
+        Answer a message directly from a sub-agent when the fast-path router is confident.
+        The last few turns of `history` are passed along with the message.
+        Returns None when the message should go through the triage model instead.
+        """
+        if self.fast_router is None:
+            return None
+        agent_name = self.fast_router.route(message)
+        if agent_name is None:
+            return None
+        if self.show_thoughts:
+            print(f"\n[Triage Thought Process] Fast path matched {agent_name} Agent, skipping triage model")
+        response = await self.delegate_to_agent(agent_name, self._with_recent_context(message, history))
+        if response.startswith("Error"):
+            # Let the triage model handle the request (and any recovery) instead
+            self.fast_router.stats["fallbacks"] += 1
+            return None
+        return response
+
+    @staticmethod
+    def _with_recent_context(message: str, history: Optional[List[Dict[str, Any]]]) -> str:
+        recent = (history or [])[-TRIAGE_FAST_PATH_CONTEXT_MESSAGES:] if TRIAGE_FAST_PATH_CONTEXT_MESSAGES > 0 else []
+        lines = [
+            f"{entry.get('role', 'user')}: {str(entry.get('content', ''))[:FAST_PATH_CONTEXT_CHARS]}"
+            for entry in recent if entry.get("content")
+        ]
+        if not lines:
+            return message
+        return "Recent conversation:\n" + "\n".join(lines) + f"\n\nCurrent request: {message}"
+
+    def get_fast_path_stats(self) -> Dict[str, float]:
+        return self.fast_router.get_stats() if self.fast_router is not None else {}
+
+    def _emit_delegation_event(self, event_type: str, agent_name: str, **data: Any):
+        """Report a delegation event to the listener registered for the current request, if any."""
+        listener = delegation_event_listener.get()
+        if listener is None:
+            return
+        try:
+            listener({"type": event_type, "agent": agent_name, **data})
+        except Exception as e:
+            print(f"Error reporting delegation event '{event_type}' for {agent_name}: {e}")
+
     @kernel_function(name="delegate_to_agent", description="Delegates a task to a specified specialized agent.")
     async def delegate_to_agent(self, agent_name: str, query: str) -> str:
         """
@@ -149,19 +288,82 @@ class TriageAgent:
             The response from the sub-agent or an error message.
         """
         if agent_name not in self.agents:
-            return f"Error: Agent '{agent_name}' is not recognized or available. Available agents are: {list(self.agents.keys())}"
+            error_msg = f"Error: Agent '{agent_name}' is not recognized or available. Available agents are: {list(self.agents.keys())}"
+            self._emit_delegation_event("delegation_error", agent_name, query=query, error=error_msg)
+            return error_msg
         
         agent_data = self.agents[agent_name]
+        if not await self._ensure_agent_ready(agent_name):
+            error_msg = f"Error: {agent_name} Agent failed to initialize: {agent_data['error']}"
+            self._emit_delegation_event("delegation_error", agent_name, query=query, error=error_msg)
+            return error_msg
+
         if self.show_thoughts:
             print(f"\n[Triage Thought Process] Delegating to {agent_name} Agent: '{query}'")
+        self._emit_delegation_event("delegation_start", agent_name, query=query)
         
         try:
             response = await agent_data["base"].invoke_agent(agent_data["instance"], query)
             if self.show_thoughts:
                 print(f"[Triage Thought Process] {agent_name} Agent Response: '{response}'")
+            self._emit_delegation_event("delegation_end", agent_name, query=query, response=response)
             return response
         except Exception as e:
             error_msg = f"Error calling {agent_name} Agent: {e}"
             if self.show_thoughts:
                 print(f"[Triage Thought Process] {error_msg}")
-            return error_msg
\ No newline at end of file
+            self._emit_delegation_event("delegation_error", agent_name, query=query, error=error_msg)
+            return error_msg
+
+    @kernel_function(
+        name="delegate_parallel",
+        description=(
+            "Delegates several independent tasks to specialized agents concurrently. "
+            "Takes a list of tasks, each an object with 'agent_name' and 'query', and returns the results labelled by agent."
+        )
+    )
+    async def delegate_parallel(self, tasks: List[Dict[str, str]]) -> str:
+        """
+        Invokes several sub-agents at once and waits for all of them.
+
+        Args:
+            tasks: List of {"agent_name": ..., "query": ...} objects. A JSON string of the same shape is also accepted.
+
+        Returns:
+            One labelled result per task, in the order given. Tasks that fail or exceed
+            DELEGATION_TIMEOUT_SECONDS report an error without affecting the others.
+        """
+        if isinstance(tasks, str):
+            try:
+                tasks = json.loads(tasks)
+            except json.JSONDecodeError as e:
+                return f"Error: 'tasks' must be a list of objects with 'agent_name' and 'query': {e}"
+        if not tasks:
+            return "Error: No tasks provided."
+
+        pairs = []
+        for task in tasks:
+            if isinstance(task, dict):
+                pairs.append((str(task.get("agent_name", "")), str(task.get("query", ""))))
+            elif isinstance(task, (list, tuple)) and len(task) == 2:
+                pairs.append((str(task[0]), str(task[1])))
+            else:
+                return f"Error: Invalid task {task!r}. Each task needs an 'agent_name' and a 'query'."
+
+        if self.show_thoughts:
+            print(f"\n[Triage Thought Process] Delegating {len(pairs)} tasks in parallel: {[name for name, _ in pairs]}")
+
+        async def run_one(agent_name: str, query: str) -> str:
+            try:
+                return await asyncio.wait_for(self.delegate_to_agent(agent_name, query), timeout=DELEGATION_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                error_msg = f"Error: {agent_name} Agent did not respond within {DELEGATION_TIMEOUT_SECONDS:g} seconds."
+                if self.show_thoughts:
+                    print(f"[Triage Thought Process] {error_msg}")
+                self._emit_delegation_event("delegation_error", agent_name, query=query, error=error_msg)
+                return error_msg
+
+        results = await asyncio.gather(*(run_one(name, query) for name, query in pairs))
+        return "\n\n".join(
+            f"[{name} Agent] Query: {query}\nResult: {result}" for (name, query), result in zip(pairs, results)
+        )
@@ -1,13 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
 import asyncio
+import base64
+import concurrent.futures
+import gzip
+import hashlib
 import json
+import queue
+import threading
+import time
 import sys
 import calendar
 from datetime import datetime
 from dotenv import load_dotenv
-import requests
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
 
 # Add the project directory and triagespeech1 folder to the Python path
 project_dir = os.path.dirname(os.path.abspath(__file__))
@@ -34,9 +56,12 @@ if os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"):
 
 # Import the speech recognition functionality
 try:
-    from agents.speech.speech_io import recognize_from_microphone, speak_text, stop_speech, stop_recognition, speak_text_async, reset_synthesis_flags
+    from agents.speech.speech_io import recognize_from_microphone, speak_text, stop_speech, stop_recognition, speak_text_async, reset_synthesis_flags, warm_up_speech, SentenceSpeechStream, STREAM_AUDIO_FORMAT, SPEECH_VOICES, start_streaming_recognition, end_streaming_recognition, strip_wav_header
     SPEECH_AVAILABLE = True
     print("Speech module imported successfully")
+    # Open the synthesizer connections in the background so the first spoken reply starts quickly
+    if os.getenv("SPEECH_WARM_UP", "true").lower() == "true":
+        threading.Thread(target=warm_up_speech, name="speech-warm-up", daemon=True).start()
 except Exception as e:
     print(f"WARNING: Speech module import failed: {e}")
     print("Ensure agents/speech/speech_io.py exists")
@@ -46,6 +71,13 @@ except Exception as e:
 try:
     from semantic_kernel.contents import ChatMessageContent
     from agents import CalendarAgent, IoTAgent, SpeechAgent, AttendanceAgent, TriageAgent # Assuming TriageAgent is also in agents
+    from agents.event_loop import get_background_loop
+    from agents.triage_agent.triage_main import delegation_event_listener
+    from agents.session_store import create_session_store, DEFAULT_SESSION_ID
+    from agents.calendar.graph_client import get_graph_client
+    from agents.calendar.event_cache import get_event_cache
+    from agents.calendar.event_categories import EventCategorizer, load_category_rules
+    from agents.attendance.attendance_skill import get_attendance_skill
     AGENTS_AVAILABLE = True
     print("All specialized agents and ChatMessageContent imported successfully.")
 except ImportError as e:
@@ -59,6 +91,14 @@ except ImportError as e:
     class SpeechAgent: pass
     class AttendanceAgent: pass
     class ChatMessageContent: pass
+    get_background_loop = None
+    delegation_event_listener = None
+    create_session_store = None
+    DEFAULT_SESSION_ID = "default"
+    get_graph_client = None
+    get_event_cache = None
+    EventCategorizer = None
+    get_attendance_skill = None
 
 # Force production mode - we don't want mock mode
 TESTING_MODE = False
@@ -69,22 +109,139 @@ try:
         triage_agent = triage_agent_instance.triage_agent # Assuming TriageAgent class has a .triage_agent attribute that is the invokable agent
         print("Triage Agent initialized successfully!")
     else:
+        triage_agent_instance = None
         triage_agent = None
         print("Triage Agent could not be initialized due to missing agent modules.")
 except Exception as e:
     print(f"ERROR initializing triage agent: {e}")
     # print("Path issue? Check that triagespeech1/triage_agent.py exists.") # This path might be obsolete
     print("Check TriageAgent class and its dependencies.")
+    triage_agent_instance = None
     triage_agent = None # Ensure triage_agent is None if initialization fails
 
+# Timeout (seconds) for a single chat turn submitted to the background event loop
+CHAT_TIMEOUT_SECONDS = float(os.getenv("CHAT_TIMEOUT_SECONDS", "120"))
+
+def run_async(coro, timeout=None):
+    """
+    Run a coroutine from a synchronous Flask handler.
+    All coroutines share one long-lived background event loop, so the async HTTP clients
+    inside the agents' AzureChatCompletion services keep their connection pools between requests.
+    """
+    if get_background_loop is None:
+        return asyncio.run(coro)
+    return get_background_loop().run(coro, timeout=timeout)
+
+def submit_async(coro) -> concurrent.futures.Future:
+    """
+    Schedule a coroutine on the shared background loop without waiting for it.
+    Returns a concurrent.futures.Future that a synchronous handler can poll or wait on.
+    """
+    if get_background_loop is None:
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(asyncio.run(coro))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return get_background_loop().submit(coro)
+
+# Build the sub-agents concurrently in the background instead of blocking startup;
+# any agent not ready yet is built on its first delegation.
+if triage_agent_instance is not None and os.getenv("TRIAGE_WARM_AGENTS", "true").lower() == "true":
+    submit_async(triage_agent_instance.warm_up())
+
+# Keyword categorization for /calendar/sync, driven by CALENDAR_CATEGORY_RULES_FILE if set
+event_categorizer = EventCategorizer(load_category_rules()) if EventCategorizer is not None else None
+
+def json_response(payload, status: int = 200) -> Response:
+    """JSON response serialized with orjson when available (much faster on large payloads)."""
+    if orjson is None:
+        response = jsonify(payload)
+        response.status_code = status
+        return response
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = 1024
+# Browsers revalidate /calendar/sync with If-None-Match after this many seconds (0 = every time)
+CALENDAR_SYNC_MAX_AGE = int(os.getenv("CALENDAR_SYNC_MAX_AGE", "0"))
+
+def compress_body(body: bytes):
+    """Compress a response body with the best encoding the client accepts. Returns (body, encoding)."""
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return body, None
+    accepted = request.headers.get("Accept-Encoding", "").lower()
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=5), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+def etag_matches(etag: str) -> bool:
+    """Weak comparison of our ETag against the request's If-None-Match header."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    strip_weak = lambda tag: tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()
+    return any(tag.strip() == "*" or strip_weak(tag) == strip_weak(etag) for tag in header.split(","))
+
+def compute_events_etag(ms_events: list, *parts) -> str:
+    """Weak ETag over the event set, using each event's changeKey (bumped by Graph on every edit)."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    for ev in ms_events:
+        digest.update(ev.get("id", "").encode())
+        version = ev.get("changeKey") or ev.get("lastModifiedDateTime")
+        if version is None:
+            version = f"{ev.get('subject')}|{ev.get('start')}|{ev.get('end')}|{ev.get('bodyPreview')}"
+        digest.update(version.encode())
+        digest.update(b"\0")
+    return f'W/"{digest.hexdigest()}"'
+
+def sse_event(event_type: str, data: dict) -> str:
+    """Format a single Server-Sent Events message."""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
 # Create a global variable to track the speech synthesizer
 speech_synthesizer = None
 
-# Global conversation history (Note: This is in-memory and shared across all users/requests, and resets on app restart)
-conversation_history = []
+# Session-keyed conversation history. Backend (in-memory LRU or SQLite shared across workers),
+# per-session length and idle TTL are configured through CHAT_HISTORY_* environment variables.
+session_store = create_session_store() if create_session_store is not None else None
+SESSION_EVICTION_INTERVAL_SECONDS = 300
+_last_session_eviction = time.monotonic()
+
+def get_session_id(data: dict) -> str:
+    """Resolve the chat session from the request body or X-Session-ID header."""
+    return str(data.get('session_id') or request.headers.get('X-Session-ID') or DEFAULT_SESSION_ID)
+
+def get_session_history(session_id: str) -> list:
+    """Return the stored history for a session, periodically evicting idle sessions."""
+    global _last_session_eviction
+    if session_store is None:
+        return []
+    now = time.monotonic()
+    if now - _last_session_eviction > SESSION_EVICTION_INTERVAL_SECONDS:
+        _last_session_eviction = now
+        evicted = session_store.evict_expired()
+        if evicted:
+            print(f"Evicted {evicted} idle chat session(s)")
+    return session_store.get_history(session_id)
+
+def record_session_turn(session_id: str, user_message: str, assistant_message: str):
+    if session_store is not None:
+        evicted = session_store.append_turn(session_id, user_message, assistant_message)
+        # Messages leaving the store's ring are summarized on the next turn instead of being lost
+        if evicted and triage_agent_instance is not None:
+            triage_agent_instance.history_manager.retire(session_id, evicted)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+# WebSocket routes (streaming speech recognition) need flask-sock
+sock = Sock(app) if Sock is not None else None
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -92,7 +249,6 @@ def chat():
     Endpoint to handle chat messages.
     Uses the triage agent to process messages and get responses.
     """
-    global conversation_history # Ensure we're using the global history
     try:
         data = request.json
         message_text = data.get('message', '')
@@ -100,37 +256,156 @@ def chat():
         if not message_text:
             return jsonify({"error": "No message provided"}), 400
         
-        print(f"Received chat message: {message_text}")
-        
-        # Add current user message to history before processing
-        # The process_message function will format the history for the agent
-        # conversation_history.append({"role": "user", "content": message_text}) # This will be handled by process_message now
+        session_id = get_session_id(data)
+        print(f"Received chat message for session {session_id}: {message_text}")
         
         # Use run_async to call the async function from the synchronous Flask context
         try:
-            # Pass the current message and a copy of the history
-            response = asyncio.run(process_message(message_text, list(conversation_history)))
+            # Pass the current message and this session's history
+            response = run_async(process_message(message_text, get_session_history(session_id), session_id), timeout=CHAT_TIMEOUT_SECONDS)
             
-            # Update history after successful processing
-            conversation_history.append({"role": "user", "content": message_text})
-            conversation_history.append({"role": "assistant", "content": response})
+            # Update history after successful processing (the store bounds its length)
+            record_session_turn(session_id, message_text, response)
 
         except Exception as e:
             print(f"Error processing message with triage agent: {e}")
             response = f"I'm having trouble connecting to my AI services: {str(e)}"
         
-        # Trim history if it gets too long to prevent excessive memory usage (optional)
-        MAX_HISTORY_LEN = 20 # Keep last 10 turns (20 messages)
-        if len(conversation_history) > MAX_HISTORY_LEN:
-            conversation_history = conversation_history[-MAX_HISTORY_LEN:]
-        
         print(f"Sending response: {response[:100]}..." if len(response) > 100 else f"Sending response: {response}")
         
-        return jsonify({"response": response})
+        return jsonify({"response": response, "session_id": session_id})
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /chat using Server-Sent Events.
+    Emits 'token' events as the triage agent generates its answer, 'delegation_start',
+    'delegation_end' and 'delegation_error' events as sub-agents are called, and a final
+    'done' event carrying the full response (or an 'error' event).
+    With "speak": true, the answer is also synthesized sentence by sentence while it is
+    generated and sent as 'audio' events (base64 raw PCM chunks, in 'seq' order); if speech
+    fails, an 'audio_error' event is sent and the text stream carries on. "voice" must be one
+    of SPEECH_VOICES.
+    """
+    data = request.json or {}
+    message_text = data.get('message', '')
+
+    if not message_text:
+        return jsonify({"error": "No message provided"}), 400
+
+    speak = bool(data.get('speak')) and SPEECH_AVAILABLE
+    if speak and data.get('voice') and data['voice'] not in SPEECH_VOICES:
+        return jsonify({"error": f"Unknown voice '{data['voice']}'", "voices": SPEECH_VOICES}), 400
+
+    session_id = get_session_id(data)
+    print(f"Received streaming chat message for session {session_id}: {message_text}")
+
+    events = queue.Queue()
+    # The sentinel is sent once the agent and, when speaking, the speech worker have both finished
+    unfinished = [2 if speak else 1]
+    unfinished_lock = threading.Lock()
+
+    def finished():
+        with unfinished_lock:
+            unfinished[0] -= 1
+            if unfinished[0] == 0:
+                events.put(None)
+
+    speech = None
+    if data.get('speak'):
+        if speak:
+            speech = SentenceSpeechStream(
+                on_audio=lambda seq, chunk: events.put({
+                    "type": "audio", "seq": seq, "format": STREAM_AUDIO_FORMAT,
+                    "data": base64.b64encode(chunk).decode("ascii")
+                }),
+                on_done=finished,
+                on_error=lambda message: events.put({"type": "audio_error", "error": message}),
+                **({"voice": data["voice"]} if data.get("voice") else {})
+            )
+        else:
+            events.put({"type": "audio_error", "error": "Speech synthesis is not available on this server."})
+
+    def emit(event):
+        events.put(event)
+        if speech is not None and event.get("type") == "token":
+            speech.feed(event["content"])
+
+    future = submit_async(process_message_stream(message_text, get_session_history(session_id), emit, session_id))
+
+    def on_future_done(_):
+        if speech is not None:
+            # Speak whatever text is left; the speech worker reports its own completion
+            speech.close()
+        finished()
+
+    future.add_done_callback(on_future_done)
+
+    def generate():
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                yield sse_event(event["type"], event)
+
+            try:
+                response = future.result()
+            except Exception as e:
+                print(f"Error processing streaming message with triage agent: {e}")
+                yield sse_event("error", {"type": "error", "error": f"I'm having trouble connecting to my AI services: {str(e)}"})
+                return
+
+            record_session_turn(session_id, message_text, response)
+
+            yield sse_event("done", {"type": "done", "response": response, "session_id": session_id})
+        finally:
+            # Client went away before the agent finished - stop the work on the loop
+            if not future.done():
+                future.cancel()
+            if speech is not None:
+                speech.cancel()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/chat/history', methods=['DELETE'])
+def chat_history_clear():
+    """
+    Endpoint to clear the conversation history of a chat session.
+    """
+    data = request.get_json(silent=True) or {}
+    session_id = get_session_id(data)
+    if session_store is not None:
+        session_store.clear(session_id)
+    if triage_agent_instance is not None:
+        triage_agent_instance.history_manager.clear(session_id)
+    return jsonify({"status": "cleared", "session_id": session_id})
+
+@app.route('/chat/router/stats', methods=['GET'])
+def chat_router_stats():
+    """
+    Endpoint reporting how often the fast-path router answered without the triage model.
+    """
+    if triage_agent_instance is None:
+        return jsonify({"error": "Triage agent is not available"}), 503
+    return jsonify(triage_agent_instance.get_fast_path_stats())
+
+@app.route('/agents/status', methods=['GET'])
+def agents_status():
+    """
+    Endpoint reporting the readiness of each sub-agent.
+    """
+    if triage_agent_instance is None:
+        return jsonify({"error": "Triage agent is not available"}), 503
+    return jsonify(triage_agent_instance.get_agent_status())
+
 @app.route('/speech/recognize', methods=['POST'])
 def speech_recognize():
     """
@@ -154,6 +429,56 @@ def speech_recognize():
         print(f"Error in speech recognition: {e}")
         return jsonify({"error": str(e)}), 500
 
+def speech_recognize_stream(ws):
+    """
+    WebSocket endpoint for continuous speech recognition of audio sent by the client.
+    The client sends binary frames of 16 kHz 16-bit mono PCM (a .wav file's header is
+    skipped) and a text frame "stop" when done; the server sends JSON text frames:
+    {"type": "interim"|"final", "text": ...}, {"type": "error", ...} and finally {"type": "end"}.
+    Query parameters: session_id, language (default en-US).
+    """
+    if not SPEECH_AVAILABLE:
+        ws.send(json.dumps({"type": "error", "error": "Speech recognition is not available on this server."}))
+        return
+
+    session_id = request.args.get('session_id') or DEFAULT_SESSION_ID
+    results = queue.Queue()
+    try:
+        recognizer = start_streaming_recognition(session_id, results.put, language=request.args.get('language', 'en-US'))
+    except Exception as e:
+        print(f"Error starting streaming recognition: {e}")
+        ws.send(json.dumps({"type": "error", "error": str(e)}))
+        return
+
+    def send_results():
+        while not results.empty():
+            ws.send(json.dumps(results.get_nowait()))
+
+    first_chunk = True
+    try:
+        while not recognizer.stopped.is_set():
+            message = ws.receive(timeout=0.05)
+            if isinstance(message, (bytes, bytearray)):
+                chunk = bytes(message)
+                if first_chunk:
+                    chunk = strip_wav_header(chunk)
+                    first_chunk = False
+                recognizer.write(chunk)
+            elif isinstance(message, str) and message.strip().lower() == 'stop':
+                recognizer.finish()
+                break
+            # Interim and final results are sent from this thread as they arrive
+            send_results()
+        send_results()
+        ws.send(json.dumps({"type": "end"}))
+    except ConnectionClosed:
+        print(f"Streaming recognition client for session {session_id} disconnected")
+    finally:
+        end_streaming_recognition(session_id, recognizer)
+
+if sock is not None:
+    sock.route('/speech/recognize/stream')(speech_recognize_stream)
+
 @app.route('/speech/synthesize', methods=['POST'])
 def synthesize_speech():
     """
@@ -213,7 +538,8 @@ def speech_stop_recognition():
             return jsonify({"result": "Speech functionality is not available on this server."}), 503
         
         # Call the stop_recognition function from speech_io
-        result = stop_recognition()
+        data = request.get_json(silent=True) or {}
+        result = stop_recognition(data.get('session_id'))
         print("Speech recognition stop result:", result)
         return jsonify({"result": result})
     except Exception as e:
@@ -250,60 +576,32 @@ def calendar_sync():
         else:
             print(f"Graph token available, length: {len(graph_token)}")
         
-        # Make request to Microsoft Graph API
-        params = {
-            "startDateTime": start_date,
-            "endDateTime": end_date,
-            "$orderby": "start/dateTime"
-        }
-        
-        print(f"Making request to Microsoft Graph API with params: {params}")
-        
-        response = requests.get(
-            "https://graph.microsoft.com/v1.0/me/calendarView",
-            headers={
-                "Authorization": f"Bearer {graph_token}",
-                "Content-Type": "application/json"
-            },
-            params=params
-        )
-        
-        # Check if request was successful
-        response.raise_for_status()
-        
-        # Parse response
-        ms_events = response.json().get("value", [])
+        if get_graph_client is None:
+            return jsonify({"error": "Graph client is not available"}), 503
+
+        # Served from the local event index; Graph is only asked for changes (delta query)
+        event_cache = get_event_cache(get_graph_client(graph_token))
+        ms_events = run_async(event_cache.get_events(start_date, end_date))
         
-        # Transform to format expected by UI calendar component
-        events = []
-        for ev in ms_events:
-            # Determine category based on keywords
-            category = "meeting"  # Default category
-            subject_lower = ev.get("subject", "").lower()
-            
-            if "task" in subject_lower or "todo" in subject_lower:
-                category = "task"
-            elif "reminder" in subject_lower:
-                category = "reminder"
-            elif "lunch" in subject_lower or "dinner" in subject_lower or "social" in subject_lower:
-                category = "social"
-            
-            # Format times correctly
-            start_time = ev.get("start", {}).get("dateTime", "")
-            end_time = ev.get("end", {}).get("dateTime", "")
-            
-            # Create event object
-            event = {
-                "id": ev.get("id", ""),
-                "title": ev.get("subject", "(No title)"),
-                "description": ev.get("bodyPreview", ""),
-                "start": start_time,
-                "end": end_time,
-                "category": category
-            }
-            events.append(event)
+        cache_headers = {
+            "ETag": compute_events_etag(ms_events, start_date, end_date, event_categorizer.fingerprint),
+            "Cache-Control": f"private, max-age={CALENDAR_SYNC_MAX_AGE}, must-revalidate",
+            "Vary": "Accept-Encoding"
+        }
+        # Unchanged event set - skip transformation, serialization and transfer entirely
+        if etag_matches(cache_headers["ETag"]):
+            return Response(status=304, headers=cache_headers)
+
+        # Transform to format expected by UI calendar component (categories from a single compiled matcher)
+        events = event_categorizer.transform(ms_events)
         
-        return jsonify({"events": events})
+        response = json_response({"events": events})
+        body, encoding = compress_body(response.get_data())
+        if encoding:
+            response.set_data(body)
+            response.headers["Content-Encoding"] = encoding
+        response.headers.update(cache_headers)
+        return response
         
     except Exception as e:
         print(f"Error syncing calendar: {e}")
@@ -326,27 +624,23 @@ def calendar_test():
                 "token_available": False
             }), 401
         
+        if get_graph_client is None:
+            return jsonify({
+                "status": "error",
+                "message": "Graph client is not available",
+                "token_available": True
+            }), 503
+        graph = get_graph_client(graph_token)
+
         # Test token by making a simple request to get user information
-        response = requests.get(
-            "https://graph.microsoft.com/v1.0/me",
-            headers={
-                "Authorization": f"Bearer {graph_token}",
-                "Content-Type": "application/json"
-            }
-        )
+        response = run_async(graph.get("/me"))
         
         # Check if request was successful
         if response.status_code == 200:
             user_data = response.json()
             
             # Also test calendar access
-            calendar_response = requests.get(
-                "https://graph.microsoft.com/v1.0/me/calendars",
-                headers={
-                    "Authorization": f"Bearer {graph_token}",
-                    "Content-Type": "application/json"
-                }
-            )
+            calendar_response = run_async(graph.get("/me/calendars"))
             
             if calendar_response.status_code == 200:
                 calendars = calendar_response.json().get("value", [])
@@ -390,7 +684,93 @@ def calendar_test():
             "token_available": graph_token is not None
         }), 500
 
-async def process_message(current_user_message: str, history: list):
+def attendance_skill_from_env():
+    """The shared AttendanceSkill for the configured container, or None if Cosmos isn't configured."""
+    endpoint, key = os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY")
+    if get_attendance_skill is None or not endpoint or not key:
+        return None
+    return get_attendance_skill(
+        endpoint, key, os.getenv("COSMOS_DATABASE", "CampusData"), os.getenv("COSMOS_CONTAINER", "Attendance")
+    )
+
+@app.route('/attendance/checkin', methods=['POST'])
+def attendance_checkin():
+    """
+    Endpoint to check one or many users in to an event, e.g. from a door badge reader.
+    Body: {"event_name": "...", "user_ids": ["...", ...]} (or a single "user_id").
+    Check-ins are idempotent, so readers can safely retry.
+    """
+    data = request.get_json(silent=True) or {}
+    event_name = (data.get('event_name') or '').strip()
+    user_ids = data.get('user_ids') or ([data['user_id']] if data.get('user_id') else [])
+    if not event_name or not isinstance(user_ids, list) or not user_ids:
+        return jsonify({"error": "event_name and user_ids are required"}), 400
+
+    skill = attendance_skill_from_env()
+    if skill is None:
+        return jsonify({"error": "Attendance storage is not available"}), 503
+
+    try:
+        result = run_async(skill.check_in_many(event_name, [str(u) for u in user_ids]))
+    except Exception as e:
+        print(f"Error checking in attendance: {e}")
+        return jsonify({"error": str(e)}), 500
+    status = 502 if result["failed"] and not result["checked_in"] else 200
+    # queued: acknowledged from the local write-behind queue, stored in Cosmos shortly after
+    return jsonify({"event_name": event_name, **result, "queued": skill.checkin_queue is not None}), status
+
+def attendance_rollups_from_env():
+    skill = attendance_skill_from_env()
+    return skill.rollups if skill is not None else None
+
+@app.route('/attendance/events/<path:event_name>', methods=['GET'])
+def attendance_event_headcount(event_name):
+    """
+    Endpoint returning the headcount of an event from the precomputed attendance rollups.
+    """
+    rollups = attendance_rollups_from_env()
+    if rollups is None:
+        return jsonify({"error": "Attendance statistics are not available"}), 503
+    stats = rollups.event_headcount(event_name)
+    if stats is None:
+        return jsonify({"error": f"No check-ins recorded for {event_name}"}), 404
+    return jsonify(stats)
+
+@app.route('/attendance/users/<user_id>', methods=['GET'])
+def attendance_user_stats(user_id):
+    """
+    Endpoint returning a user's check-in count and attendance streaks.
+    """
+    rollups = attendance_rollups_from_env()
+    if rollups is None:
+        return jsonify({"error": "Attendance statistics are not available"}), 503
+    stats = rollups.user_stats(user_id)
+    if stats is None:
+        return jsonify({"error": f"No attendance recorded for {user_id}"}), 404
+    return jsonify(stats)
+
+@app.route('/attendance/courses/<course>', methods=['GET'])
+def attendance_course_stats(course):
+    """
+    Endpoint returning a course's attendance rate (and one student's, with ?user_id=).
+    """
+    rollups = attendance_rollups_from_env()
+    if rollups is None:
+        return jsonify({"error": "Attendance statistics are not available"}), 503
+    stats = rollups.course_stats(course, request.args.get('user_id'))
+    if stats is None:
+        return jsonify({"error": f"No attendance recorded for course {course}"}), 404
+    return jsonify(stats)
+
+async def build_agent_messages(current_user_message: str, history: list, session_id: str) -> list:
+    """
+    Convert the session history plus the current user message into ChatMessageContent objects
+    for the triage agent. Recent turns are kept verbatim within the triage token budget and
+    older turns are folded into a cached rolling summary by the triage HistoryManager.
+    """
+    return await triage_agent_instance.history_manager.build_messages(session_id, history, current_user_message)
+
+async def process_message(current_user_message: str, history: list, session_id: str = DEFAULT_SESSION_ID):
     """
     Process a user message through the triage agent, including conversation history.
     Returns the full response as a string.
@@ -398,17 +778,11 @@ async def process_message(current_user_message: str, history: list):
     """
     try:
         if triage_agent is not None and AGENTS_AVAILABLE:
-            messages_for_agent = []
-            # Add historical messages
-            for entry in history:
-                try:
-                    messages_for_agent.append(ChatMessageContent(role=entry["role"], content=entry["content"]))
-                except KeyError:
-                    print(f"Warning: Skipping history entry due to missing 'role' or 'content': {entry}")
-                    continue
-            
-            # Add current user message
-            messages_for_agent.append(ChatMessageContent(role="user", content=current_user_message))
+            fast_response = await triage_agent_instance.try_fast_path(current_user_message, history)
+            if fast_response is not None:
+                return fast_response
+
+            messages_for_agent = await build_agent_messages(current_user_message, history, session_id)
 
             full_response = []
             async for response_chunk in triage_agent.invoke(messages=messages_for_agent):
@@ -427,6 +801,39 @@ async def process_message(current_user_message: str, history: list):
         # It's better to re-raise or return a specific error that the calling function can handle
         raise # Re-raise the exception to be caught by the /chat endpoint's error handler
 
+async def process_message_stream(current_user_message: str, history: list, emit, session_id: str = DEFAULT_SESSION_ID):
+    """
+    Streaming counterpart of process_message.
+    Calls emit(event) for every token chunk and every sub-agent delegation as they happen,
+    and returns the full response as a string once the triage agent is done.
+    """
+    if not AGENTS_AVAILABLE:
+        return "The Triage Agent's components are not available. Please check the server configuration."
+    if triage_agent is None:
+        return "The triage agent is not available at the moment. Please try again later."
+
+    listener_token = delegation_event_listener.set(emit)
+    try:
+        fast_response = await triage_agent_instance.try_fast_path(current_user_message, history)
+        if fast_response is not None:
+            emit({"type": "token", "content": fast_response})
+            return fast_response
+
+        messages_for_agent = await build_agent_messages(current_user_message, history, session_id)
+        full_response = []
+        async for response_chunk in triage_agent.invoke_stream(messages=messages_for_agent):
+            # Function-call and tool chunks carry no text; don't send empty token events for them
+            content_str = str(response_chunk.content) if response_chunk.content else ""
+            if content_str:
+                full_response.append(content_str)
+                emit({"type": "token", "content": content_str})
+        return "".join(full_response)
+    except Exception as e:
+        print(f"Error processing streaming message: {e}")
+        raise
+    finally:
+        delegation_event_listener.reset(listener_token)
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 9001))
     app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
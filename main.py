@@ -4,7 +4,6 @@ from dotenv import load_dotenv
 
 load_dotenv() # Load the environment before calling the agents
 
-from semantic_kernel.contents import ChatMessageContent
 from agents import CalendarAgent, IoTAgent, SpeechAgent, AttendanceAgent, TriageAgent
 
 SHOW_THOUGHTS = "true"
@@ -16,11 +15,14 @@ async def main():
 
     triage_agent_instance = TriageAgent(show_thoughts=SHOW_THOUGHTS, available_agents=[CalendarAgent, IoTAgent, SpeechAgent, AttendanceAgent])
     triage_agent = triage_agent_instance.triage_agent
+    # Build sub-agents in the background while waiting for the first input
+    warm_up_task = asyncio.create_task(triage_agent_instance.warm_up())
     conversation_history = []
 
     while True:
         try:
-            user_input = input("\nUser > ")
+            # Read input off the event loop so the warm-up can progress meanwhile
+            user_input = await asyncio.to_thread(input, "\nUser > ")
         except (EOFError, KeyboardInterrupt):
             print("\nExiting...")
             break
@@ -32,15 +34,10 @@ async def main():
 
         print("\nTriageAgent processing...")
         
-        # Prepare messages for the agent, including history
-        messages_for_agent = []
-        for entry in conversation_history:
-            # Create ChatMessageContent objects from stored history dicts
-            messages_for_agent.append(ChatMessageContent(role=entry["role"], content=entry["content"]))
-        # Create ChatMessageContent for the current user input
-        messages_for_agent.append(ChatMessageContent(role="user", content=user_input))
-
         try:
+            # Prepare messages for the agent: rolling summary of older turns plus recent history
+            messages_for_agent = await triage_agent_instance.history_manager.build_messages("cli", conversation_history, user_input)
+
             agent_response_content = ""
             async for message_chunk in triage_agent.invoke(messages=messages_for_agent):
                 if message_chunk.content:
@@ -56,6 +53,13 @@ async def main():
         except Exception as e:
             print(f"\n[TriageAgent ERROR] An error occurred during invocation: {e}")
 
+    # Don't leave the warm-up running past the session
+    warm_up_task.cancel()
+    try:
+        await warm_up_task
+    except asyncio.CancelledError:
+        pass
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
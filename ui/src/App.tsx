@@ -16,6 +16,28 @@ const globalAnimationState = {
   transitionSpeed: 0.02 // Controls how fast the object expands/contracts
 };
 
+// Per-tab chat session id so the backend keeps a separate conversation history for each user
+// crypto.randomUUID only exists in secure contexts (https or localhost), not on plain http LAN addresses
+const generateSessionId = (): string => {
+  if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  if (typeof crypto !== 'undefined' && typeof crypto.getRandomValues === 'function') {
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+};
+
+const getChatSessionId = (): string => {
+  let sessionId = sessionStorage.getItem('chat_session_id');
+  if (!sessionId) {
+    sessionId = generateSessionId();
+    sessionStorage.setItem('chat_session_id', sessionId);
+  }
+  return sessionId;
+};
+
 // Animation loop running outside of React to ensure continuous animation
 (function setupGlobalAnimation() {
   const animate = (timestamp: number) => {
@@ -551,7 +573,7 @@ function App() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ message: text }),
+        body: JSON.stringify({ message: text, session_id: getChatSessionId() }),
       });
 
       if (!response.ok) {